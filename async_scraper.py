@@ -0,0 +1,225 @@
+"""
+Asyncio mode of the end-of-day scraper.
+
+Minute bars and time-sales pages are fetched for many symbols at once,
+so one slow symbol doesn't hold the whole run. The output is the same
+`data/<date>/<symbol>.csv` files that stock_scraper.main writes.
+"""
+from urllib.parse import urlparse
+from datetime import datetime
+from time import monotonic
+import asyncio
+import json
+import logging
+
+import aiohttp
+
+from proxy_pool import ProxyPool
+from storage import get_storage
+from run_journal import RunJournal
+from stock_scraper import (
+    CHUNK_SIZE, DATA_TIMEZONE, STORAGE_BACKEND, TIME_SLICES, TRADES_URL, SliceFailException, TradesPageParser,
+    backoff_time, get_stocks, get_proxies, is_scraping_time, minute_data_url, minute_data_to_df, trades_to_df,
+    save_result,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = 200  # requests in flight across all the hosts
+MAX_SYMBOLS = 50  # symbols scraped at the same time
+HOST_RATE_LIMITS = {  # requests per second
+    "query1.finance.yahoo.com": 20,
+    "www.nasdaq.com": 100,
+}
+REQUEST_TIMEOUT = 12
+MINUTE_DATA_ATTEMPTS = 5
+TRADES_PAGE_ATTEMPTS = 30
+
+
+class RateLimiter:
+    """
+    Spaces out the requests to a host, so there are no more than `rate` of them per second
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_time = 0
+
+    async def wait(self):
+        now = monotonic()
+        delay = self.next_time - now
+        self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def gather_or_cancel(*coroutines):
+    """
+    asyncio.gather that cancels the other tasks when one of them fails, so they don't keep
+    running with nobody waiting for them
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class AsyncScraper:
+
+    def __init__(self, session, proxy_pool=None, concurrency=MAX_CONCURRENCY, rate_limits=None):
+        self.session = session
+        self.semaphore = asyncio.Semaphore(concurrency)
+        rate_limits = HOST_RATE_LIMITS if rate_limits is None else rate_limits
+        self.limiters = {host: RateLimiter(rate) for host, rate in rate_limits.items()}
+        self.proxy_pool = proxy_pool
+
+    async def fetch(self, url, proxy=None, parser=None):
+        """
+        Returns the response body and the seconds it took to get it.
+        With a `parser` the body is fed to it chunk by chunk as it arrives
+        and what parser.close() returns is given instead of the body
+        """
+        limiter = self.limiters.get(urlparse(url).hostname)
+        if limiter is not None:
+            await limiter.wait()
+        async with self.semaphore:
+            start = monotonic()
+            async with self.session.get(url, proxy=proxy) as response:
+                # a 403 or 5xx page of a proxy is a failed request, not a page without the table
+                response.raise_for_status()
+                if parser is None:
+                    return await response.read(), monotonic() - start
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    if not parser.done:
+                        parser.feed(chunk)
+                return parser.close(), monotonic() - start
+
+    async def get_proxy(self):
+        if self.proxy_pool is None:
+            return None
+        while True:
+            proxy = self.proxy_pool.acquire(wait=False)
+            if proxy is not None:
+                return proxy
+            await asyncio.sleep(max(self.proxy_pool.wait_time(), 0.1))
+
+    async def get_minute_data(self, symbol, now):
+        url = minute_data_url(symbol, now)
+        for attempt in range(1, MINUTE_DATA_ATTEMPTS + 1):
+            try:
+                content, _ = await self.fetch(url)
+                return minute_data_to_df(json.loads(content), now)
+            except Exception as e:
+                logger.error("{}: {}".format(symbol, e))
+                await asyncio.sleep(backoff_time(attempt))
+        raise RuntimeError("Failed to get the minute data for {}".format(symbol))
+
+    async def get_trades_page(self, symbol, time, pageno):
+        url = TRADES_URL.format(symbol=symbol, time=time, pageno=pageno)
+        for _ in range(TRADES_PAGE_ATTEMPTS):
+            proxy = await self.get_proxy()
+            try:
+                (rows, max_page), latency = await self.fetch(
+                    url, proxy="http://{}".format(proxy) if proxy else None, parser=TradesPageParser())
+            except Exception as e:
+                logger.error("{}; {}".format(e, proxy))
+            else:
+                if rows is not None:
+                    if proxy is not None:
+                        self.proxy_pool.report_success(proxy, latency)
+                    return rows, max_page
+                logger.error('The table is missing; {}'.format(proxy))
+
+            if proxy is None:
+                await asyncio.sleep(5)
+            else:
+                self.proxy_pool.report_failure(proxy)
+        raise RuntimeError("Failed to get {}".format(url))
+
+    async def get_time_slice(self, symbol, time, journal=None):
+        if journal is not None and journal.is_slice_done(symbol, time):
+            return journal.load_slice(symbol, time)
+
+        trades, max_page = await self.get_trades_page(symbol, time, 1)
+        pages = await gather_or_cancel(*(
+            self.get_trades_page(symbol, time, pn) for pn in range(2, (max_page or 1) + 1)
+        ))
+        for rows, _ in pages:
+            trades.extend(rows)
+        if journal is not None:
+            journal.save_slice(symbol, time, trades)
+        return trades
+
+    async def scrape_symbol(self, symbol, today, storage, journal=None):
+        minute_data = await self.get_minute_data(symbol, today)
+        if minute_data is None:
+            return
+        del minute_data['volume']
+
+        trades = []
+        failed = []
+        slices = await asyncio.gather(*(self.get_time_slice(symbol, time, journal) for time in TIME_SLICES),
+                                      return_exceptions=True)
+        for time, rows in zip(TIME_SLICES, slices):
+            if isinstance(rows, Exception):
+                failed.append(time)
+            else:
+                trades.extend(rows)
+        if failed:
+            raise SliceFailException("{}: failed to pull the time slices {}".format(symbol, failed))
+        save_result(storage, today, symbol, minute_data, trades_to_df(trades, today))
+
+
+async def scrape(symbols, today, storage, proxy_pool=None, journal=None, max_symbols=MAX_SYMBOLS, **kwargs):
+    symbols_semaphore = asyncio.Semaphore(max_symbols)
+    connector = aiohttp.TCPConnector(limit=kwargs.get("concurrency", MAX_CONCURRENCY))
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        scraper = AsyncScraper(session, proxy_pool, **kwargs)
+
+        async def scrape_symbol(symbol):
+            async with symbols_semaphore:
+                start = datetime.now()
+                try:
+                    await scraper.scrape_symbol(symbol, today, storage, journal)
+                except Exception as e:
+                    logger.error("{}: {}".format(symbol, e))
+                    if journal is not None:
+                        journal.mark_failed(symbol, e)
+                else:
+                    print(symbol, datetime.now() - start)
+                    if journal is not None:
+                        journal.mark_done(symbol)
+
+        if journal is not None:
+            symbols = [symbol for symbol in symbols if not journal.should_skip(symbol)]
+        await asyncio.gather(*(scrape_symbol(symbol) for symbol in symbols))
+
+
+def main():
+    today = datetime.now(tz=DATA_TIMEZONE).replace(second=0, microsecond=0)
+    print(today)
+    if not is_scraping_time(today):
+        return
+
+    storage = get_storage(STORAGE_BACKEND)
+    proxies = get_proxies()
+    proxy_pool = ProxyPool(proxies) if proxies else None
+    journal = RunJournal(today.date())
+    asyncio.run(scrape(list(get_stocks()), today, storage, proxy_pool=proxy_pool, journal=journal))
+    if proxy_pool is not None:
+        proxy_pool.save()
+
+    dead_letters = journal.dead_letters()
+    if dead_letters:
+        print("Dead-lettered: {}".format(", ".join(dead_letters)))
+    print(datetime.now(tz=DATA_TIMEZONE) - today)
+
+
+if __name__ == "__main__":
+    main()
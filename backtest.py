@@ -0,0 +1,177 @@
+"""
+Backtest of the history_strategies signals with array operations.
+
+A strategy combination buys when all of its strategies say buy and sells
+when all of them say sell. The position is flat or long a share: a buy
+while flat enters at the close, a sell while long exits at the close, the
+other signals are ignored. Every combination of a symbol is run at once
+on a combinations x days array built from one indicator frame:
+
+    df = indicator_frame(get_data_yahoo(symbol, start, end))
+    profit_df = get_profit(df, ("ao", "vi"))  # close, buy_sig, sell_sig, profit
+    summary = sweep(symbols, start, end)      # a row per symbol and combination
+"""
+from itertools import combinations
+import logging
+
+import numpy as np
+import pandas as pd
+
+from market_data import get_data_many
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("close", "ao", "vi")
+CLOSE_WINDOW = 19
+AO_FAST, AO_SLOW, AO_MEAN = 5, 34, 30
+VI_PERIOD = 14
+INDICATOR_COLUMNS = ["close", "buy_close", "sell_close", "ao", "buy_ao", "sell_ao", "vi", "buy_vi", "sell_vi"]
+
+
+def strategy_signals(high, low, close, close_window=CLOSE_WINDOW, ao_fast=AO_FAST, ao_slow=AO_SLOW,
+                     ao_mean=AO_MEAN, vi_period=VI_PERIOD):
+    """
+    The indicators and the buy/sell signals of every strategy, by name.
+    The prices are series, or days x symbols frames to get the signals of all the symbols at once
+    """
+    signals = {}
+
+    # just price
+    previous_max = close.rolling(window=close_window).max().shift(1)
+    signals['buy_close'] = close > previous_max
+    signals['sell_close'] = close < previous_max
+
+    # AO = SMA(High+Low)/2, 5 Periods) - SMA(High+Low/2, 34 Periods)
+    high_low_mean = (high + low) / 2
+    ao = high_low_mean.rolling(window=ao_fast).mean() - high_low_mean.rolling(window=ao_slow).mean()
+    ao_average = ao.rolling(window=ao_mean).mean()
+    signals['ao'] = ao
+    signals['buy_ao'] = (ao > 0) & (ao_average < 0)
+    signals['sell_ao'] = (ao < 0) & (ao_average > 0)
+
+    # Vortex Indicator
+    previous_close = close.shift(1)
+    tr = np.fmax(high, previous_close) - np.fmin(low, previous_close)
+    trp = tr.rolling(window=vi_period).sum()
+    vmp = (high - low.shift(1)).abs()
+    vmm = (low - high.shift(1)).abs()
+    vi = (vmp.rolling(window=vi_period).sum() - vmm.rolling(window=vi_period).sum()) / trp
+    signals['vi'] = vi
+    signals['buy_vi'] = vi >= 0
+    signals['sell_vi'] = vi < 0
+    return signals
+
+
+def indicator_frame(df, **params):
+    """
+    The close and the buy/sell signals of every strategy,
+    `df` has the open, high, low, close columns in any case
+    """
+    df = df.rename(columns=str.lower)
+    signals = strategy_signals(df.high, df.low, df.close, **params)
+    return pd.DataFrame(dict(close=df.close, **signals), index=df.index)[INDICATOR_COLUMNS]
+
+
+def strategy_combinations(strategies=STRATEGIES):
+    """
+    All the combinations, the largest ones first
+    """
+    return [strats for i in reversed(range(1, len(strategies) + 1)) for strats in combinations(strategies, i)]
+
+
+def combination_signals(df, combos):
+    """
+    The buy and sell arrays of the combinations, combinations x days
+    """
+    buy = np.ones((len(combos), len(df)), dtype=bool)
+    sell = np.ones((len(combos), len(df)), dtype=bool)
+    for row, strats in enumerate(combos):
+        for s in strats:
+            buy[row] &= df["buy_" + s].to_numpy(dtype=bool)
+            sell[row] &= df["sell_" + s].to_numpy(dtype=bool)
+    return buy, sell
+
+
+def forward_fill_index(mask):
+    """
+    For every cell the column of the last True cell of its row up to it, 0 before the first one
+    """
+    index = np.where(mask, np.arange(mask.shape[-1]), 0)
+    return np.maximum.accumulate(index, axis=-1)
+
+
+def run(close, buy, sell):
+    """
+    Runs the position state machine on the combinations x days signals in one pass,
+    `close` is the days or broadcasts to the signals (e.g. symbols x days with symbols x days signals).
+    Returns the entry and exit masks and the cumulative profit, each shaped like the signals
+    """
+    close = np.broadcast_to(np.asarray(close, dtype=float), buy.shape)
+    rows = np.arange(buy.shape[0])[:, None]
+
+    # a buy wins over a sell on the same day, the state is the last signal given
+    signal = np.where(buy, 1, np.where(sell, -1, 0))
+    long = signal[rows, forward_fill_index(signal != 0)] > 0
+    was_long = np.zeros_like(long)
+    was_long[:, 1:] = long[:, :-1]
+
+    entry = long & ~was_long
+    exit = ~long & was_long
+    entry_price = np.take_along_axis(close, forward_fill_index(entry), axis=-1)
+    profit = np.cumsum(np.where(exit, close - entry_price, 0), axis=-1)
+    return entry, exit, profit
+
+
+def get_profit(df, strats):
+    """
+    The indicator frame with the buy_sig, sell_sig prices of the trades and the cumulative profit
+    """
+    df = df.copy()
+    buy, sell = combination_signals(df, [strats])
+    entry, exit, profit = run(df.close, buy, sell)
+    df["buy"], df["sell"] = buy[0], sell[0]
+    df["profit"] = profit[0]
+    df["buy_sig"] = np.where(entry[0], df.close, 0)
+    df["sell_sig"] = np.where(exit[0], df.close, 0)
+    return df
+
+
+def backtest(df, strategies=STRATEGIES):
+    """
+    Summary of every strategy combination on the indicator frame,
+    a row per combination with the profit, the closed trades and the winning ones
+    """
+    combos = strategy_combinations(strategies)
+    close = df.close.to_numpy(dtype=float)
+    buy, sell = combination_signals(df, combos)
+    entry, exit, profit = run(close, buy, sell)
+
+    entry_price = close[forward_fill_index(entry)]
+    wins = (exit & (close > entry_price)).sum(axis=1)
+    trades = exit.sum(axis=1)
+    return pd.DataFrame(dict(
+        strategies=[" ".join(strats) for strats in combos],
+        profit=profit[:, -1] if len(df) else 0.0,
+        profit_pct=profit[:, -1] / close[0] * 100 if len(df) else 0.0,
+        trades=trades,
+        wins=wins,
+        open=(entry.sum(axis=1) > trades),
+    ))
+
+
+def sweep(symbols, start, end, strategies=STRATEGIES):
+    """
+    backtest of every symbol, the daily bars are fetched once per symbol in parallel
+    """
+    frames = []
+    for symbol, bars in get_data_many(symbols, start, end).items():
+        try:
+            summary = backtest(indicator_frame(bars), strategies)
+        except Exception as e:
+            logger.error("{}: {}".format(symbol, e))
+            continue
+        summary.insert(0, "symbol", symbol)
+        frames.append(summary)
+    if not frames:
+        return pd.DataFrame(columns=["symbol", "strategies", "profit", "profit_pct", "trades", "wins", "open"])
+    return pd.concat(frames, ignore_index=True)
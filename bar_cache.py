@@ -0,0 +1,121 @@
+"""
+Local cache of the yahoo chart bars for live sessions.
+
+The bars are kept in memory per (symbol, interval, date). The first get of
+a day loads the session from the open, every next one only requests the
+bars from the last cached timestamp on and merges them in, the last cached
+bar is replaced as it may have been still in progress. Only the days from
+the latest one requested on are kept, so a notebook running for days holds
+a single session.
+
+    cache = BarCache()
+    df = cache.get("AAPL", now)  # open, high, low, close, volume of the day so far
+"""
+import threading
+import logging
+
+import pandas as pd
+import pytz
+
+import http_pool
+
+logger = logging.getLogger(__name__)
+
+DATA_TIMEZONE = pytz.timezone("US/Eastern")
+CHART_URL = "https://query1.finance.yahoo.com/v7/finance/chart/{symbol}?period1={start:.0f}&period2={end:.0f}" \
+            "&interval={interval}&indicators=quote&includeTimestamps=true"
+
+
+def chart_to_df(payload, tz):
+    """
+    The bars of a yahoo chart response, rows without a close are kept as NaN
+    """
+    result = payload['chart']['result']
+    if not result:
+        return None
+    data = result[0]
+    if 'timestamp' not in data:
+        return None
+    index = pd.to_datetime(data['timestamp'], unit='s', utc=True).tz_convert(tz)
+    return pd.DataFrame(data['indicators']['quote'][0], index=index)
+
+
+class BarCache:
+
+    def __init__(self, interval="1m", timeout=10):
+        self.interval = interval
+        self.timeout = timeout
+        self.bars = {}  # (symbol, interval, date) -> frame
+        self.session = None  # the latest date requested, the days before it are dropped
+        self.lock = threading.Lock()
+        self.stats = dict(requests=0, bytes=0, bars=0)
+
+    def session_start(self, now):
+        return now.astimezone(DATA_TIMEZONE).replace(hour=9, minute=30, second=0, microsecond=0)
+
+    def fetch(self, symbol, start, end, tz):
+        url = CHART_URL.format(symbol=symbol, start=start.timestamp(), end=end.timestamp(), interval=self.interval)
+        response = http_pool.get(url, timeout=self.timeout)
+        df = chart_to_df(response.json(), tz)
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['bytes'] += len(response.content)
+            self.stats['bars'] += 0 if df is None else len(df)
+        return df
+
+    def get(self, symbol, now):
+        """
+        Returns a copy of the bars of the day up to `now` in the timezone of `now`.
+        The first get of a new day drops the days before it
+        """
+        date = now.astimezone(DATA_TIMEZONE).date()
+        key = (symbol, self.interval, date)
+        with self.lock:
+            if self.session is None or date > self.session:
+                self._drop(date)
+                self.session = date
+            cached = self.bars.get(key)
+
+        if cached is None or cached.empty:
+            start = self.session_start(now)
+        else:
+            start = cached.index[-1]
+        if start > now:
+            return self.until(cached, now)
+
+        new = self.fetch(symbol, start, now, now.tzinfo)
+        with self.lock:
+            cached = self.bars.get(key)
+            if new is None or new.empty:
+                return self.until(cached, now)
+            if cached is not None:
+                new = pd.concat([cached[cached.index < new.index[0]], new])
+            new = new[~new.index.duplicated(keep='last')]
+            self.bars[key] = new
+        return self.until(new, now)
+
+    @staticmethod
+    def until(df, now):
+        """
+        A copy of the bars up to `now`, the callers can't change the cached frames
+        """
+        return None if df is None else df[df.index <= now].copy()
+
+    def _drop(self, before=None):
+        for key in list(self.bars):
+            if before is None or key[2] < before:
+                del self.bars[key]
+
+    def clear(self, before=None):
+        """
+        Drops the cached days before the date, or all of them
+        """
+        with self.lock:
+            self._drop(before)
+
+
+bar_cache = BarCache()
+
+
+def get_minute_data(symbol, now):
+    return bar_cache.get(symbol, now)
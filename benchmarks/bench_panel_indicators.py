@@ -0,0 +1,81 @@
+"""
+Compares panel_indicators.compute on a panel with uneven calendars with the indicators of every symbol's own frame.
+
+The symbols miss random days (halts, gaps in the data) and some are listed later,
+the panel values on the days a symbol has a bar must be the ones of its own frame.
+
+    python benchmarks/bench_panel_indicators.py --symbols 3000 --days 500
+"""
+from time import perf_counter
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from panel_indicators import Panel, compute, symbol_frame  # noqa: E402
+
+COLUMNS = ["RSI", "PLUS_DI", "MINUS_DI", "ADX", "OpeningGap", "Recent5daysAvgVolume", "VolumeGap",
+           "Prev89daysMaxClose", "MaxHigh90Days"]
+
+
+def make_frames(symbols, days, missing=0.02, seed=0):
+    """
+    Random walk daily bars, every symbol without a share of the days and a tenth of them listed later
+    """
+    rnd = np.random.default_rng(seed)
+    dates = pd.bdate_range("2016-01-04", periods=days).date
+    frames = {}
+    for i in range(symbols):
+        close = 50 * np.exp(np.cumsum(rnd.normal(0, 0.02, days)))
+        open_ = close * np.exp(rnd.normal(0, 0.01, days))
+        high = np.maximum(open_, close) * (1 + rnd.random(days) * 0.02)
+        low = np.minimum(open_, close) * (1 - rnd.random(days) * 0.02)
+        df = pd.DataFrame(dict(Open=open_, High=high, Low=low, Close=close, Volume=rnd.integers(1e5, 1e7, days)),
+                          index=pd.Index(dates, name="Date"))
+        keep = rnd.random(days) >= missing
+        if i % 10 == 0:
+            keep[:rnd.integers(days // 2)] = False
+        frames["S{}".format(i)] = df[keep]
+    return frames
+
+
+def per_symbol(frames):
+    return {symbol: symbol_frame(compute(Panel.from_frames({symbol: df})), symbol) for symbol, df in frames.items()}
+
+
+def timeit(method, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = method(*args)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=300)
+    parser.add_argument("--days", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    frames = make_frames(args.symbols, args.days)
+
+    loop_time, expected = timeit(per_symbol, frames, repeat=args.repeat)
+    panel_time, wide = timeit(lambda: compute(Panel.from_frames(frames)), repeat=args.repeat)
+
+    for symbol, df in expected.items():
+        result = symbol_frame(wide, symbol).loc[df.index]
+        pd.testing.assert_frame_equal(result[COLUMNS], df[COLUMNS], check_dtype=False, rtol=1e-9)
+    print("symbols: {}, days: {}".format(args.symbols, args.days))
+    print("per symbol: {:.3f}s".format(loop_time))
+    print("panel:      {:.3f}s ({:.1f}x)".format(panel_time, loop_time / panel_time))
+
+
+if __name__ == "__main__":
+    main()
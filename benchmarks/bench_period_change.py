@@ -0,0 +1,93 @@
+"""
+Compares movers.get_period_changes with N13's get_period_change called per symbol and period.
+
+    python benchmarks/bench_period_change.py --symbols 3200 --minutes 390
+"""
+from time import perf_counter
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from movers import PERIODS, get_period_changes  # noqa: E402
+
+
+def get_period_change(series, period):
+    """
+    The N13 version
+    """
+    start_value = end_value = change = None
+    if type(period) is int:
+        # get the latest valid value from the previous period
+        prev_series = series[:-period]
+        li = prev_series.last_valid_index()
+        if li:
+            start_value = prev_series[li]
+
+        period_series = series[-period:]
+        li = period_series.last_valid_index()
+        if li:
+            end_value = period_series[li]
+    else:
+        fi = series.first_valid_index()
+        if fi:
+            start_value = series[fi]
+
+        li = series.last_valid_index()
+        if li:
+            end_value = series[li]
+    if None not in (start_value, end_value):
+        change = (end_value / start_value - 1) * 100
+    return change
+
+
+def period_changes_loop(closes, periods):
+    return pd.DataFrame({p: [get_period_change(closes[symbol], p) for symbol in closes.columns] for p in periods},
+                        index=closes.columns, dtype=float)
+
+
+def make_closes(symbols, minutes, missing=0.2, seed=0):
+    """
+    Random walk minute closes of a session with a share of the minutes missing, minutes x symbols
+    """
+    rnd = np.random.default_rng(seed)
+    index = pd.date_range("2018-03-01 09:30", periods=minutes, freq="min", tz="US/Eastern")
+    values = 50 * np.exp(np.cumsum(rnd.normal(0, 0.002, (minutes, symbols)), axis=0))
+    values[rnd.random((minutes, symbols)) < missing] = np.nan
+    return pd.DataFrame(values, index=index, columns=["S{}".format(i) for i in range(symbols)])
+
+
+def timeit(method, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = method(*args)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=3200)
+    parser.add_argument("--minutes", type=int, default=390)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    closes = make_closes(args.symbols, args.minutes)
+
+    loop_time, expected = timeit(period_changes_loop, closes, PERIODS, repeat=args.repeat)
+    array_time, result = timeit(get_period_changes, closes, PERIODS, repeat=args.repeat)
+
+    pd.testing.assert_frame_equal(result, expected)
+    print("symbols: {}, minutes: {}".format(args.symbols, args.minutes))
+    print("loop:  {:.3f}s".format(loop_time))
+    print("array: {:.3f}s ({:.1f}x)".format(array_time, loop_time / array_time))
+
+
+if __name__ == "__main__":
+    main()
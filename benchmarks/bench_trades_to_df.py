@@ -0,0 +1,87 @@
+"""
+Compares the columnar stock_scraper.trades_to_df with the per-row loop it replaced.
+
+    python benchmarks/bench_trades_to_df.py --rows 300000
+"""
+from datetime import datetime
+from time import perf_counter
+import argparse
+import random
+import re
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stock_scraper import DATA_TIMEZONE, trades_to_df  # noqa: E402
+
+
+def trades_to_df_loop(trades, date):
+    raw_data = dict(time=[], price=[], volume=[])
+    for time, price, volume in trades:
+        time_str = re.sub(r'[^\d:]+', '', time)
+        hour, minute, *_ = time_str.split(':')
+        time = date.replace(hour=int(hour), minute=int(minute))
+        price = float(re.sub(r'[^\d\.]+', '', price))
+        volume = int(re.sub(r'[^\d]+', '', volume))
+
+        raw_data['time'].append(time)
+        raw_data['price'].append(price)
+        raw_data['volume'].append(volume)
+
+    df = pd.DataFrame(raw_data)
+    df = df[df.volume >= 1000]
+    df['cost'] = df.price * df.volume * 100
+    df['trades_count'] = 1
+    df = df.groupby(['time'])[['cost', 'volume', 'trades_count']].sum()
+    return df
+
+
+def make_trades(rows, seed=0):
+    """
+    Rows looking like the ones of the nasdaq time-sales table
+    """
+    rnd = random.Random(seed)
+    trades = []
+    for _ in range(rows):
+        seconds = rnd.randrange(9 * 3600 + 30 * 60, 16 * 3600)
+        trades.append((
+            "{}:{:02d}:{:02d} ET".format(seconds // 3600, seconds // 60 % 60, seconds % 60),
+            "$ {:,.2f}".format(rnd.uniform(10, 1200)),
+            "{:,}".format(rnd.choice([100, 200, 500, 1000, 1500, 5000, 25000])),
+        ))
+    return trades
+
+
+def timeit(method, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = method(*args)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    date = DATA_TIMEZONE.localize(datetime(2018, 3, 1, 16, 0))
+    trades = make_trades(args.rows)
+
+    loop_time, expected = timeit(trades_to_df_loop, trades, date, repeat=args.repeat)
+    columnar_time, result = timeit(trades_to_df, trades, date, repeat=args.repeat)
+
+    pd.testing.assert_frame_equal(result, expected, check_index_type=False, check_freq=False)
+    print("rows: {}".format(args.rows))
+    print("loop:     {:.3f}s".format(loop_time))
+    print("columnar: {:.3f}s ({:.1f}x)".format(columnar_time, loop_time / columnar_time))
+
+
+if __name__ == "__main__":
+    main()
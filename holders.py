@@ -0,0 +1,190 @@
+"""
+Crawler of the institutional holders of a stock and of their position stats (N18).
+
+The first holders page has the link to the last page in its pager, so all
+the other listing pages are requested right away. Every holder row links
+to the holder's detail page, whose total positions and market value are
+requested as soon as its listing page arrives. The listing and detail
+pages share one pool of `max_workers` threads and are parsed with lxml.
+
+The holders of a listing page are yielded as a frame once all their
+detail pages are in, so the result grows while the crawl is running:
+
+    for frame in iter_holders("AMZN"):
+        ...
+    df = load_holders("AMZN")   # Name, DetailURL, SharesHeld, Value, TotalPositions, TotalMktValue
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import parse_qsl, urlparse
+from time import sleep
+import logging
+
+from lxml import html
+import pandas as pd
+
+import http_pool
+from stock_scraper import backoff_time
+
+logger = logging.getLogger(__name__)
+
+HOLDERS_URL = "https://www.nasdaq.com/symbol/{}/institutional-holdings"
+MAX_WORKERS = 20
+TIMEOUT = 20
+ATTEMPTS = 4
+HOLDERS_TABLE = './/*[@id="quotes_content_left_pnlInsider"]//table'
+LAST_PAGE_LINK = './/*[@id="quotes_content_left_lb_LastPage"]'
+STATS_TABLE = './/*[@id="position-stats"]'
+COLUMNS = ["Name", "DetailURL", "SharesHeld", "Value", "TotalPositions", "TotalMktValue"]
+
+
+def to_int(text):
+    """
+    "1,000" -> 1000, None for no text
+    """
+    if text is None or not text.strip():
+        return None
+    return int(text.strip().replace(",", ""))
+
+
+def get_page(url, path):
+    """
+    The parsed page, once it has the element at `path`. Sometimes we get blocked or other errors,
+    so the page is requested again a few times
+    """
+    for attempt in range(1, ATTEMPTS + 1):
+        try:
+            tree = html.fromstring(http_pool.get(url, timeout=TIMEOUT).content)
+        except Exception as e:
+            logger.warning("{}: {}".format(url, e))
+        else:
+            if tree.find(path) is not None:
+                return tree
+            logger.warning("{} isn't on {}".format(path, url))
+        sleep(backoff_time(attempt))
+    raise Exception("Cannot access data on {}. You must've been blocked.".format(url))
+
+
+def page_count(tree):
+    """
+    The number of holders pages, from the last page link of the pager
+    """
+    link = tree.find(LAST_PAGE_LINK)
+    if link is None or not link.get("href"):
+        return 1
+    return int(dict(parse_qsl(urlparse(link.get("href")).query)).get("page", 1))
+
+
+def page_url(url, num):
+    return "{}?page={}".format(url, num)
+
+
+def parse_holders(tree):
+    """
+    The holders of a listing page: name, detail page link, shares held and value
+    """
+    holders = []
+    for tr in tree.find(HOLDERS_TABLE).iter("tr"):
+        cells = [el for el in tr if isinstance(el.tag, str)]
+        if len(cells) < 4 or cells[0].tag == "th":
+            continue  # it's the header
+        name_cell, date_cell, shares_cell, *_, value_cell = cells
+        link = name_cell.find(".//a")
+        if link is None:
+            continue
+        holders.append(dict(
+            Name=link.text_content().strip(),
+            DetailURL=link.get("href"),
+            SharesHeld=to_int(shares_cell.text_content()),
+            Value=to_int(value_cell.text_content()),
+        ))
+    return holders
+
+
+def parse_position_stats(tree):
+    """
+    The total positions and total value of a holder's detail page
+    """
+    rows = tree.find(STATS_TABLE).findall(".//tr")
+    first_row, *_, last_row = rows
+    positions = first_row.find('.//*[@align="right"]')
+    value = last_row.find('.//*[@align="right"]')
+    return (None if positions is None else to_int(positions.text_content()),
+            None if value is None else to_int(value.text_content()))
+
+
+def get_listing(url):
+    return parse_holders(get_page(url, HOLDERS_TABLE))
+
+
+def get_position_stats(url):
+    try:
+        return parse_position_stats(get_page(url, STATS_TABLE))
+    except Exception as e:
+        logger.error("Position stats of {}: {}".format(url, e))
+        return None, None
+
+
+def iter_holders(symbol, max_workers=MAX_WORKERS):
+    """
+    Yields the holders of every listing page with their position stats, a frame per page,
+    in the order the pages complete
+    """
+    url = HOLDERS_URL.format(symbol.lower())
+    first_page = get_page(url, HOLDERS_TABLE)
+    pages = page_count(first_page)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}  # future -> ("listing", page number) or ("detail", page number, row)
+        waiting = {}  # page number -> [holders, detail pages not in yet]
+        pending = set()
+
+        def add_listing(num, holders):
+            waiting[num] = [holders, len(holders)]
+            for row, holder in enumerate(holders):
+                future = executor.submit(get_position_stats, holder["DetailURL"])
+                futures[future] = ("detail", num, row)
+                pending.add(future)
+
+        def take(num):
+            holders = waiting.pop(num)[0]
+            return pd.DataFrame.from_records(holders, columns=COLUMNS)
+
+        for num in range(2, pages + 1):
+            future = executor.submit(get_listing, page_url(url, num))
+            futures[future] = ("listing", num)
+            pending.add(future)
+        add_listing(1, parse_holders(first_page))
+        if not waiting[1][1]:
+            yield take(1)
+
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, num, *row = futures.pop(future)
+                    if kind == "listing":
+                        try:
+                            holders = future.result()
+                        except Exception as e:
+                            logger.error("Holders page {} of {}: {}".format(num, symbol, e))
+                            holders = []
+                        add_listing(num, holders)
+                    else:
+                        positions, total_value = future.result()
+                        waiting[num][0][row[0]].update(TotalPositions=positions, TotalMktValue=total_value)
+                        waiting[num][1] -= 1
+                    if not waiting[num][1]:
+                        yield take(num)
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def load_holders(symbol, max_workers=MAX_WORKERS):
+    """
+    All the holders of the stock with their position stats
+    """
+    frames = list(iter_holders(symbol, max_workers))
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(frames, ignore_index=True)
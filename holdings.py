@@ -0,0 +1,326 @@
+"""
+Crawler of the nasdaq institutional-holdings pages with a store per filing quarter.
+
+The holdings only change when the 13F filings of a quarter come in, so they
+are kept in one SQLite table, `n16_data_cache/holdings.sqlite`, a row per
+filing quarter and symbol with numeric columns and the ETag and
+Last-Modified the server sent. A refresh within the quarter sends
+conditional requests and a 304 keeps the stored holdings, only the symbols
+whose page changed are downloaded, parsed and upserted again. The ranking
+reads the whole universe of a quarter with one query.
+
+The requests in flight adapt to the server: every window of successful
+requests adds one, a throttled one (429, 503 or a dropped connection)
+halves them and the worker backs off before trying again.
+
+    crawler = HoldingsCrawler()
+    crawler.refresh(symbols)   # {"fresh": .., "not_modified": .., "changed": .., "unchanged": .., "failed": ..}
+    df = crawler.frame(symbols)  # a row per symbol, one read
+"""
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from datetime import datetime
+from time import sleep, time
+import threading
+import logging
+import sqlite3
+import math
+import os
+
+from lxml import html
+import pandas as pd
+
+import http_pool
+from stock_scraper import backoff_time
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = "n16_data_cache"
+STORE_PATH = os.path.join(CACHE_DIR, "holdings.sqlite")
+HOLDINGS_URL = "http://www.nasdaq.com/symbol/{}/institutional-holdings"
+TIMEOUT = 20
+MAX_AGE = 24 * 60 * 60  # seconds the stored holdings are used without revalidating them
+MIN_WORKERS = 1
+START_WORKERS = 3
+MAX_WORKERS = 20
+ATTEMPTS = 5
+THROTTLED = (429, 503)
+FIELDS = [
+    "price", "total_shares", "institutional_ownership",
+    "increased_holders", "increased_shares", "decreased_holders", "decreased_shares", "held_holders", "held_shares",
+    "new_holders", "new_shares", "sold_holders", "sold_shares",
+]
+
+
+def quarter_key(now=None):
+    """
+    The quarter of the filings shown now, the one before the current quarter, e.g. "2018Q4" in February 2019
+    """
+    now = now or datetime.now()
+    this_quarter_num = math.ceil(now.month / 3)
+    if this_quarter_num == 1:
+        return "{}Q4".format(now.year - 1)
+    return "{}Q{}".format(now.year, this_quarter_num - 1)
+
+
+def to_number(t):
+    """
+    None -> 0, "1,000" -> 1000.0, "$ 12.50" -> 12.5, "65.43%" -> 65.43, None for a text that isn't a number
+    """
+    string_value = ("0" if t is None else t).replace(",", "").replace("$", "").replace("%", "").strip()
+    try:
+        return float(string_value)
+    except ValueError:
+        return None
+
+
+def parse_holdings(content):
+    """
+    The price, institutional ownership, active and new/sold out positions of a holdings page
+    """
+    tree = html.fromstring(content)
+    data = {}
+    # Price
+    div = tree.find('.//div[@id="qwidget_lastsale"]')
+    if div is not None:
+        data["price"] = to_number(div.text)
+
+    # Institutional Ownership
+    table = tree.find('.//div[@class="infoTable marginT15px marginL15px"]')
+    if table is not None:
+        for row in table.findall('.//tr'):
+            th_cell, td_cell = row
+            title, value = th_cell.text, to_number(td_cell.text)
+            if title == "Total Shares Outstanding (millions)":
+                data["total_shares"] = value
+            elif title == "Institutional Ownership":
+                data["institutional_ownership"] = value
+
+    # Active positions
+    table = tree.find('.//div[@class="infoTable paddingT5px"]')
+    if table is not None:
+        for row in table.findall('.//tr'):
+            first, second, third = row
+            label, holders, shares = first.text, to_number(second.text), to_number(third.text)
+            if label == "Increased Positions":
+                data["increased_holders"] = holders
+                data["increased_shares"] = shares
+            elif label == "Decreased Positions":
+                data["decreased_holders"] = holders
+                data["decreased_shares"] = shares
+            elif label == "Held Positions":
+                data["held_holders"] = holders
+                data["held_shares"] = shares
+
+    # New and sold out positions
+    table = tree.find('.//div[@class="infoTable floatL marginT15px"]')
+    if table is not None:
+        for row in table.findall('.//tr'):
+            first, second, third = row
+            label, holders, shares = first.text, to_number(second.text), to_number(third.text)
+            if label == "New Positions":
+                data["new_holders"] = holders
+                data["new_shares"] = shares
+            elif label == "Sold Out Positions":
+                data["sold_holders"] = holders
+                data["sold_shares"] = shares
+    return data
+
+
+def holding_fields(data):
+    """
+    The holdings without the price, which changes every day
+    """
+    return {key: value for key, value in data.items() if key != "price"}
+
+
+class ThrottledException(Exception):
+    pass
+
+
+class AdaptiveLimit:
+    """
+    The number of requests allowed in flight, additive increase and multiplicative decrease
+    """
+
+    def __init__(self, start=START_WORKERS, minimum=MIN_WORKERS, maximum=MAX_WORKERS):
+        self.limit = start
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit // 2)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
+
+
+class HoldingsStore:
+    """
+    The holdings of every quarter and symbol in one SQLite table, with the validators of their pages
+    """
+
+    def __init__(self, path=STORE_PATH, quarter=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.quarter = quarter or quarter_key()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS holdings (quarter TEXT NOT NULL, symbol TEXT NOT NULL, {}, "
+                "etag TEXT, last_modified TEXT, checked REAL, PRIMARY KEY (quarter, symbol))".format(
+                    ", ".join("{} REAL".format(field) for field in FIELDS)))
+
+    def get(self, symbol):
+        """
+        {"data": .., "etag": .., "last_modified": .., "checked": timestamp} of the quarter or None
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT {}, etag, last_modified, checked FROM holdings WHERE quarter = ? AND symbol = ?".format(
+                    ", ".join(FIELDS)), (self.quarter, symbol)).fetchone()
+        if row is None:
+            return None
+        data = {field: value for field, value in zip(FIELDS, row) if value is not None}
+        return dict(data=data, etag=row[-3], last_modified=row[-2], checked=row[-1])
+
+    def set(self, symbol, entry):
+        """
+        Inserts or replaces the entry of the symbol
+        """
+        columns = FIELDS + ["etag", "last_modified", "checked"]
+        values = [entry["data"].get(field) for field in FIELDS] + [entry.get(name) for name in columns[-3:]]
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO holdings (quarter, symbol, {}) VALUES (?, ?, {}) "
+                "ON CONFLICT (quarter, symbol) DO UPDATE SET {}".format(
+                    ", ".join(columns), ", ".join("?" * len(columns)),
+                    ", ".join("{0} = excluded.{0}".format(name) for name in columns)),
+                [self.quarter, symbol] + values)
+
+    def frame(self, symbols=None):
+        """
+        The holdings of the quarter, a row per symbol, of the given symbols only or of all of them
+        """
+        with self.lock:
+            df = pd.read_sql_query("SELECT symbol, {} FROM holdings WHERE quarter = ?".format(", ".join(FIELDS)),
+                                   self.connection, params=(self.quarter,))
+        if symbols is not None:
+            df = df[df.symbol.isin(list(symbols))].reset_index(drop=True)
+        return df
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class HoldingsCrawler:
+
+    def __init__(self, path=STORE_PATH, quarter=None, max_age=MAX_AGE, limit=None):
+        self.store = HoldingsStore(path, quarter)
+        self.max_age = max_age
+        self.limit = limit or AdaptiveLimit()
+        self.stats = Counter()
+
+    def request(self, symbol, entry):
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        self.limit.acquire()
+        throttled = False
+        try:
+            response = http_pool.get(HOLDINGS_URL.format(symbol.lower()), headers=headers, timeout=TIMEOUT)
+            throttled = response.status_code in THROTTLED
+        except Exception as e:
+            throttled = True
+            raise ThrottledException(str(e))
+        finally:
+            self.limit.release(throttled)
+        if throttled:
+            raise ThrottledException("HTTP {}".format(response.status_code))
+        return response
+
+    def fetch(self, symbol):
+        """
+        Revalidates or downloads the page of the symbol, returns what happened to its stored holdings
+        """
+        entry = self.store.get(symbol)
+        if entry is not None and time() - entry.get("checked", 0) < self.max_age:
+            return "fresh"
+
+        for attempt in range(1, ATTEMPTS + 1):
+            try:
+                response = self.request(symbol, entry)
+                break
+            except ThrottledException as e:
+                logger.warning("{}: {}, attempt {}".format(symbol, e, attempt))
+                sleep(backoff_time(attempt))
+        else:
+            return "failed"
+
+        if response.status_code == 304 and entry is not None:
+            entry["checked"] = time()
+            self.store.set(symbol, entry)
+            return "not_modified"
+        if response.status_code != 200:
+            logger.error("{}: HTTP {}".format(symbol, response.status_code))
+            return "failed"
+
+        data = parse_holdings(response.content)
+        if not data:
+            logger.error("No data for {}".format(symbol))
+            return "failed"
+        changed = entry is None or holding_fields(entry.get("data", {})) != holding_fields(data)
+        self.store.set(symbol, dict(
+            data=data,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            checked=time(),
+        ))
+        return "changed" if changed else "unchanged"
+
+    def refresh(self, symbols):
+        """
+        Brings the stored holdings of the symbols up to date, returns the counts of what happened to them
+        """
+        def fetch(symbol):
+            try:
+                return self.fetch(symbol)
+            except Exception as e:
+                logger.error("{}: {}".format(symbol, e))
+                return "failed"
+
+        results = Counter()
+        with ThreadPoolExecutor(max_workers=self.limit.maximum) as executor:
+            for result in executor.map(fetch, symbols):
+                results[result] += 1
+        self.stats.update(results)
+        return dict(results)
+
+    def frame(self, symbols=None):
+        """
+        The stored holdings of the symbols, a row per symbol
+        """
+        return self.store.frame(symbols)
@@ -0,0 +1,153 @@
+"""
+Shared keep-alive HTTP sessions for the scrapers.
+
+There is one requests.Session per proxy (and one for direct requests), so
+the TCP/TLS connections are reused between the pages instead of a new
+handshake per `requests.get`. The pools count the connections they open
+and the requests they send, get_stats shows how many requests reused a
+connection.
+"""
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+import requests
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+POOL_CONNECTIONS = 10  # hosts with cached pools per session
+POOL_MAXSIZE = 20  # keep-alive connections per host
+POOL_BLOCK = False
+
+
+class PoolStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def count(self, requests=0, new_connections=0):
+        with self.lock:
+            self.requests += requests
+            self.new_connections += new_connections
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.new_connections = 0
+
+
+stats = PoolStats()
+
+
+class CountingPoolMixin:
+
+    def _new_conn(self):
+        stats.count(new_connections=1)
+        return super()._new_conn()
+
+    def urlopen(self, *args, **kwargs):
+        stats.count(requests=1)
+        return super().urlopen(*args, **kwargs)
+
+
+class CountingHTTPConnectionPool(CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+COUNTING_POOL_CLASSES = {
+    "http": CountingHTTPConnectionPool,
+    "https": CountingHTTPSConnectionPool,
+}
+
+
+class CountingAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connection pools (direct and proxied) report to `stats`
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = COUNTING_POOL_CLASSES
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        manager.pool_classes_by_scheme = COUNTING_POOL_CLASSES
+        return manager
+
+
+_sessions = {}
+_lock = threading.Lock()
+_config = dict(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=POOL_BLOCK)
+
+
+def configure(**kwargs):
+    """
+    Sets the adapter arguments (pool_connections, pool_maxsize, pool_block, max_retries)
+    for the sessions created from now on
+    """
+    with _lock:
+        _config.update(kwargs)
+
+
+def make_session(proxy=None):
+    session = requests.Session()
+    adapter = CountingAdapter(**_config)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if proxy:
+        session.proxies = {'http': "http://{}".format(proxy)}
+    return session
+
+
+def get_session(proxy=None):
+    session = _sessions.get(proxy)
+    if session is None:
+        with _lock:
+            session = _sessions.get(proxy)
+            if session is None:
+                session = _sessions[proxy] = make_session(proxy)
+    return session
+
+
+def get(url, proxy=None, **kwargs):
+    return get_session(proxy).get(url, **kwargs)
+
+
+def discard(proxy):
+    """
+    Closes the session of a proxy that is not going to be used anymore
+    """
+    with _lock:
+        session = _sessions.pop(proxy, None)
+    if session is not None:
+        session.close()
+
+
+def close():
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def get_stats():
+    with stats.lock:
+        requests_count, new_connections = stats.requests, stats.new_connections
+    return dict(
+        sessions=len(_sessions),
+        requests=requests_count,
+        new_connections=new_connections,
+        reused_connections=max(requests_count - new_connections, 0),
+    )
+
+
+def log_stats():
+    logger.info("HTTP pool: {sessions} sessions, {requests} requests, "
+                "{new_connections} new connections, {reused_connections} reused".format(**get_stats()))
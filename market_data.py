@@ -0,0 +1,153 @@
+"""
+Market data for the notebooks, in one place and cached.
+
+    from market_data import get_data_yahoo, get_minute_data, get_data_many
+
+    df = get_data_yahoo("AAPL", start, end)  # Open, High, Low, Close, Volume per Date
+    frames = get_data_many(symbols, start, end)  # {symbol: df}, fetched in parallel
+    bars = get_minute_data("AAPL", now)  # 1m bars of the session of `now`
+
+The yahoo chart responses are saved on disk. The bars of a closed session
+never change, so they never expire, the ones of a session in progress
+expire after a short TTL. Daily requests are keyed by dates, not by the
+exact timestamps, so `end=datetime.now()` still hits the cache.
+The intraday bars of today come from bar_cache, which only fetches the new ones.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import time as now_ts
+import hashlib
+import logging
+import json
+import os
+
+import pandas as pd
+import pytz
+
+import http_pool
+from bar_cache import CHART_URL, bar_cache, chart_to_df
+
+logger = logging.getLogger(__name__)
+
+DATA_TIMEZONE = pytz.timezone("US/Eastern")
+CACHE_DIR = ".market_data_cache"
+LIVE_TTL = 60  # seconds, for the ranges that include a session in progress
+SETTLE_MINUTES = 30  # after the close the last bars may still be corrected
+MAX_WORKERS = 20
+TIMEOUT = 10
+COLUMNS = dict(open="Open", high="High", low="Low", close="Close", volume="Volume")
+
+
+class ResponseCache:
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+
+    def path(self, key):
+        name = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.root, name[:2], name + ".json")
+
+    def get(self, key):
+        try:
+            with open(self.path(key), "r") as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if entry["expires"] is not None and entry["expires"] < now_ts():
+            return None
+        return entry["payload"]
+
+    def set(self, key, payload, ttl=None):
+        """
+        ttl is None for the responses that never change
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(dict(key=key, expires=None if ttl is None else now_ts() + ttl, payload=payload), f)
+        os.replace(tmp_path, path)
+
+
+response_cache = ResponseCache()
+
+
+def is_closed(end):
+    """
+    Whether the bars up to `end` are final, i.e. its session closed and settled
+    """
+    current = datetime.now(tz=DATA_TIMEZONE)
+    end = end.astimezone(DATA_TIMEZONE)
+    if end.date() < current.date():
+        return True
+    settled = current.replace(hour=16, minute=0, second=0, microsecond=0) + timedelta(minutes=SETTLE_MINUTES)
+    return end.date() == current.date() and current >= settled
+
+
+def get_chart(symbol, start, end, interval="1d"):
+    """
+    The yahoo chart response for the range, from the cache when it's there
+    """
+    start, end = start.astimezone(DATA_TIMEZONE), end.astimezone(DATA_TIMEZONE)
+    if interval.endswith(("d", "wk", "mo")):
+        # whole days, so the key doesn't change during the day
+        start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = min(end.replace(hour=23, minute=59, second=0, microsecond=0), datetime.now(tz=DATA_TIMEZONE))
+        key = "chart/{}/{}/{}/{}".format(symbol, interval, start.date(), end.date())
+    else:
+        key = "chart/{}/{}/{:.0f}/{:.0f}".format(symbol, interval, start.timestamp() // 60, end.timestamp() // 60)
+
+    payload = response_cache.get(key)
+    if payload is None:
+        url = CHART_URL.format(symbol=symbol, start=start.timestamp(), end=end.timestamp(), interval=interval)
+        payload = http_pool.get(url, timeout=TIMEOUT).json()
+        if payload['chart']['result']:
+            response_cache.set(key, payload, ttl=None if is_closed(end) else LIVE_TTL)
+    return payload
+
+
+def get_data_yahoo(symbol, start, end, interval="1d"):
+    """
+    Open, High, Low, Close, Volume bars indexed by Date,
+    the dates of the exchange for the daily intervals, the times in its timezone for the intraday ones
+    """
+    payload = get_chart(symbol, start, end, interval)
+    df = chart_to_df(payload, DATA_TIMEZONE)
+    if df is None:
+        print(symbol, payload)
+        return None
+
+    df = df.rename(columns=COLUMNS)[list(COLUMNS.values())]
+    if interval.endswith(("d", "wk", "mo")):
+        df.index = pd.Index(df.index.date, name="Date")
+    else:
+        df.index.name = "Date"
+    return df
+
+
+def get_data_many(symbols, start, end, interval="1d", max_workers=MAX_WORKERS):
+    """
+    get_data_yahoo for many symbols in parallel, {symbol: df} of the symbols that have data
+    """
+    def get(symbol):
+        try:
+            return symbol, get_data_yahoo(symbol, start, end, interval)
+        except Exception as e:
+            logger.error("{}: {}".format(symbol, e))
+            return symbol, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return {symbol: df for symbol, df in executor.map(get, symbols) if df is not None}
+
+
+def get_minute_data(symbol, now):
+    """
+    The 1m bars of the session of `now`, NaN rows included, in the timezone of `now`
+    """
+    if not is_closed(now):
+        return bar_cache.get(symbol, now)
+
+    start = now.astimezone(DATA_TIMEZONE).replace(hour=9, minute=30, second=0, microsecond=0)
+    end = start.replace(hour=16, minute=0)
+    payload = get_chart(symbol, start, end, interval="1m")
+    return chart_to_df(payload, now.tzinfo)
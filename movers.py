@@ -0,0 +1,180 @@
+"""
+Top movers of a symbol universe from its minute closes, without sorting the universe.
+
+The closes of all the symbols are aligned on the union of their minutes
+as one symbols x minutes array, so the period changes of every symbol are
+computed at once from the index of the last valid close at each minute
+(a forward fill of positions). The top and bottom K of a period are
+picked with a partial selection and only those K are sorted, and the
+cumulative changes of the movers are forward filled on the aligned index.
+
+    movers = Movers(minute_data)   # {symbol: close series}
+    movers.changes                 # symbols x periods, like get_period_change
+    get_period_changes(closes)     # the same from a minutes x symbols frame
+    movers.top("All day", 10)      # the 10 bull movers, change by symbol
+    movers.top(5, 10, largest=False)
+    movers.cumulative(symbols)     # minutes x symbols, % from the first close
+
+    falling_count(lows_of_the_symbols, 10)  # N14's last minute bear velocity of every symbol
+"""
+import numpy as np
+import pandas as pd
+
+PERIODS = [1, 5, 15, 30, 60, "All day"]
+
+
+def align(series):
+    """
+    The {symbol: series} values on the union of their indexes, symbols x index, NaN where missing
+    """
+    symbols = list(series)
+    if not symbols:
+        return symbols, pd.Index([]), np.empty((0, 0))
+    index = series[symbols[0]].index
+    for symbol in symbols[1:]:
+        if not series[symbol].index.equals(index):
+            index = index.union(series[symbol].index)
+    values = np.full((len(symbols), len(index)), np.nan)
+    for row, symbol in enumerate(symbols):
+        s = series[symbol]
+        values[row] = s.to_numpy(dtype=float) if s.index.equals(index) else s.reindex(index).to_numpy(dtype=float)
+    return symbols, index, values
+
+
+def last_valid_index(values):
+    """
+    For every cell the column of the last non-NaN value of its row up to it, -1 before the first one
+    """
+    index = np.where(np.isnan(values), -1, np.arange(values.shape[-1]))
+    return np.maximum.accumulate(index, axis=-1)
+
+
+def first_valid_index(values):
+    """
+    The column of the first non-NaN value of every row, -1 if there is none
+    """
+    valid = ~np.isnan(values)
+    return np.where(valid.any(axis=-1), valid.argmax(axis=-1), -1)
+
+
+def pick(values, index):
+    """
+    values[row, index[row]] of an index per row or per cell of the row, NaN where the index is -1
+    """
+    rows = np.arange(values.shape[0]).reshape((-1,) + (1,) * (index.ndim - 1))
+    return np.where(index >= 0, values[rows, np.maximum(index, 0)], np.nan)
+
+
+def period_changes(values, periods=PERIODS):
+    """
+    The % change of every row over every period, periods x symbols. An int period
+    is the last `period` minutes: from the last close before them to the last close
+    within them, like get_period_change. Any other period is the whole day
+    """
+    out = np.full((len(periods), values.shape[0]), np.nan)
+    minutes = values.shape[-1]
+    if not minutes:
+        return out
+    last = last_valid_index(values)
+    end_all = pick(values, last[:, -1])
+    for row, period in enumerate(periods):
+        if type(period) is int:
+            if period >= minutes:
+                continue
+            start = pick(values, last[:, minutes - period - 1])
+            end = np.where(last[:, -1] >= minutes - period, end_all, np.nan)
+        else:
+            start, end = pick(values, first_valid_index(values)), end_all
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[row] = (end / start - 1) * 100
+    return out
+
+
+def get_period_changes(closes, periods=PERIODS):
+    """
+    get_period_change of every column of an aligned minutes x symbols close frame
+    for all the periods at once, a symbols x periods frame
+    """
+    values = period_changes(closes.to_numpy(dtype=float).T, periods)
+    return pd.DataFrame(values.T, index=closes.columns, columns=list(periods))
+
+
+def top_k(values, k, largest=True):
+    """
+    The columns of the k largest (or smallest) values of every row, in order, the NaNs last.
+    Only the k picked by a partial selection are sorted
+    """
+    values = np.atleast_2d(values)
+    keys = -values if largest else values
+    keys = np.where(np.isnan(keys), np.inf, keys)
+    k = min(k, keys.shape[-1])
+    if not k:
+        return np.empty((keys.shape[0], 0), dtype=int)
+    if k < keys.shape[-1]:
+        columns = np.argpartition(keys, k - 1, axis=-1)[:, :k]
+    else:
+        columns = np.broadcast_to(np.arange(k), keys.shape).copy()
+    order = np.argsort(np.take_along_axis(keys, columns, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(columns, order, axis=-1)
+
+
+def cumulative_changes(values):
+    """
+    The % change of every row from its first value, the gaps keep the previous change
+    """
+    first = pick(values, first_valid_index(values))
+    first = np.where(first == 0, np.nan, first)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        changes = (values / first[:, None] - 1) * 100
+    return pick(changes, last_valid_index(values))
+
+
+def tail(arrays, length):
+    """
+    The last `length` values of the arrays as rows, right-aligned and NaN padded on the left
+    """
+    out = np.full((len(arrays), length), np.nan)
+    for row, values in enumerate(arrays):
+        values = np.asarray(values[-length:] if length else [], dtype=float)
+        if len(values):
+            out[row, length - len(values):] = values
+    return out
+
+
+def falling_count(lows, window=10):
+    """
+    The number of the last `window` minutes with a lower low than the minute before, per array of lows,
+    NaN for the arrays shorter than the window. The last value of N14's bear_velocity
+    """
+    lengths = np.array([len(values) for values in lows])
+    lows = tail(lows, window + 1)
+    count = (lows[:, 1:] < lows[:, :-1]).sum(axis=-1).astype(float)
+    count[lengths < window] = np.nan
+    return count
+
+
+class Movers:
+
+    def __init__(self, minute_data, periods=PERIODS):
+        """
+        `minute_data` is {symbol: close series} of the day
+        """
+        self.periods = list(periods)
+        self.symbols, self.index, self.values = align(minute_data)
+        self.period_values = period_changes(self.values, self.periods)
+        self.changes = pd.DataFrame(self.period_values.T, index=self.symbols, columns=self.periods)
+
+    def top(self, period, k, largest=True):
+        """
+        The k largest (or smallest) changes of the period by symbol, best first
+        """
+        values = self.period_values[self.periods.index(period)]
+        columns = top_k(values, k, largest)[0]
+        return pd.Series(values[columns], index=[self.symbols[c] for c in columns], name=period)
+
+    def cumulative(self, symbols):
+        """
+        The cumulative % changes of the symbols, minutes x symbols
+        """
+        rows = [self.symbols.index(symbol) for symbol in symbols]
+        return pd.DataFrame(cumulative_changes(self.values[rows]).T, index=self.index, columns=list(symbols))
@@ -0,0 +1,181 @@
+"""
+Option chains of many stocks as one columnar contract table.
+
+Every stock's default chain is requested first and the other expiration
+dates it lists are queued as soon as it arrives, all on one pool of
+`max_workers` threads. The calls and puts go straight into columns and
+the table has a row per contract, indexed by the contract symbol:
+
+    table = load_chains(["AAPL", "BAC"])
+    table[["stock", "type", "strike", "volume", "open_interest", "bid", "ask", "expiration"]]
+
+The volume changes between two polls are one join of the new table with
+the volumes saved from the previous ones:
+
+    volumes = VolumeSnapshot()
+    fills = option_fills(table, volumes.changes(table), now)   # the option_fill rows of the traded contracts
+    volumes.evict(now)
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime as dt
+import logging
+
+import numpy as np
+import pandas as pd
+
+import http_pool
+from options_flow import DAY
+
+logger = logging.getLogger(__name__)
+
+OPTIONS_URL = "https://query1.finance.yahoo.com/v7/finance/options/{symbol}"
+MAX_WORKERS = 20
+TIMEOUT = 10
+TYPES = (("Calls", "calls"), ("Puts", "puts"))
+QUOTE_FIELDS = dict(price="regularMarketPrice", open="regularMarketOpen", previous_close="regularMarketPreviousClose")
+CONTRACT_FIELDS = dict(strike="strike", volume="volume", open_interest="openInterest", bid="bid", ask="ask",
+                       last_price="lastPrice", implied_volatility="impliedVolatility", expiration="expiration")
+COLUMNS = ["stock", "type"] + list(QUOTE_FIELDS) + list(CONTRACT_FIELDS)
+
+
+def fetch_chain(symbol, date=None):
+    """
+    The results of the options request of a stock, of the default expiration or of `date`
+    """
+    url = OPTIONS_URL.format(symbol=symbol)
+    if date is not None:
+        url = "{}?date={}".format(url, date)
+    try:
+        chain = http_pool.get(url, timeout=TIMEOUT).json()['optionChain']
+    except Exception as e:  # network problems or wrong server answers
+        logger.error("Failed to get the options of {} {}: {}".format(symbol, date or "", e))
+        return []
+    if chain['error']:
+        logger.error("{} {}: {}".format(symbol, date or "", chain['error']))
+        return []
+    return chain['result']
+
+
+def parse_chain(symbol, results):
+    """
+    The contracts of the results as columns, a list per column
+    """
+    columns = {name: [] for name in ["contract"] + COLUMNS}
+    for result in results:
+        quote = result.get('quote', {})
+        for option in result.get('options', []):
+            for option_type, key in TYPES:
+                contracts = option.get(key, [])
+                columns["contract"].extend(contract['contractSymbol'] for contract in contracts)
+                columns["stock"].extend([symbol] * len(contracts))
+                columns["type"].extend([option_type] * len(contracts))
+                for name, field in QUOTE_FIELDS.items():
+                    columns[name].extend([quote.get(field, np.nan)] * len(contracts))
+                for name, field in CONTRACT_FIELDS.items():
+                    columns[name].extend(contract.get(field, np.nan) for contract in contracts)
+    return columns
+
+
+def to_table(parts):
+    """
+    One table of the parse_chain columns, the numbers as floats
+    """
+    data = {name: [value for part in parts for value in part[name]] for name in ["contract"] + COLUMNS}
+    index = pd.Index(data.pop("contract"), name="contract")
+    table = pd.DataFrame({name: data[name] if name in ("stock", "type") else np.array(data[name], dtype=float)
+                          for name in COLUMNS}, index=index)
+    return table[~table.index.duplicated(keep="last")]
+
+
+def load_chains(symbols, all_expirations=True, max_workers=MAX_WORKERS):
+    """
+    The contracts of the stocks, of all their expiration dates or of the default one only
+    """
+    parts = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_chain, symbol): (symbol, None) for symbol in symbols}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                symbol, date = futures.pop(future)
+                results = future.result()
+                parts.append(parse_chain(symbol, results))
+                if date is not None or not all_expirations:
+                    continue
+                # the default chain is the first date, the other ones are requested right away
+                for result in results:
+                    for date in result.get('expirationDates', [])[1:]:
+                        future = executor.submit(fetch_chain, symbol, date)
+                        futures[future] = (symbol, date)
+                        pending.add(future)
+    return to_table(parts)
+
+
+class VolumeSnapshot:
+    """
+    The last volume seen of every contract, the changes of a new table are computed with one join
+    """
+
+    def __init__(self):
+        self.volumes = pd.Series(dtype=float)
+        self.expirations = pd.Series(dtype=float)
+
+    def changes(self, table):
+        """
+        The volume change of every contract of the table since the previous tables, NaN for the new ones,
+        and saves the volumes of the table. The contracts missing from it keep their last volume
+        """
+        changes = table.volume - self.volumes.reindex(table.index)
+        self.volumes = table.volume.combine_first(self.volumes)
+        self.expirations = table.expiration.combine_first(self.expirations)
+        return changes
+
+    def evict(self, now):
+        """
+        Drops the contracts expired before `now` (a datetime or a timestamp), returns their number.
+        A contract expires at the end of its expiration day
+        """
+        now = now.timestamp() if isinstance(now, dt) else now
+        live = (self.expirations + DAY > now).reindex(self.volumes.index, fill_value=True)
+        self.volumes = self.volumes[live]
+        self.expirations = self.expirations.reindex(self.volumes.index)
+        return int((~live).sum())
+
+    def __len__(self):
+        return len(self.volumes)
+
+
+def option_fills(table, changes, time):
+    """
+    The options_flow.option_fill rows of the contracts whose volume went up
+    """
+    traded = table[changes > 0]
+    volume_diff = changes[changes > 0]
+    cost = volume_diff * 100 * traded.last_price
+    strike_div_price = (traded.strike / traded.price - 1) * 100
+    spread = traded.ask - traded.bid
+    position = (1 - (traded.ask - traded.last_price) / spread.where(spread != 0)) * 100
+
+    fills = []
+    for i, (contract, row) in enumerate(traded.iterrows()):
+        fills.append(dict(
+            stock=row.stock,
+            price=row.price,
+            type=row.type,
+            time=time,
+            expiration=dt.fromtimestamp(row.expiration),
+            strike=row.strike,
+            contact=contract,
+            last_price=row.last_price,
+            bid=row.bid,
+            ask=row.ask,
+            volume=int(row.volume),
+            open_interest=None if np.isnan(row.open_interest) else int(row.open_interest),
+            implied_volatility=row.implied_volatility,
+            volume_diff=int(volume_diff.iloc[i]),
+            cost=cost.iloc[i],
+            strike_div_price=strike_div_price.iloc[i],
+            last_price_position=None if np.isnan(position.iloc[i]) else "{:.0f}".format(position.iloc[i]),
+        ))
+    return fills
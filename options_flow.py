@@ -0,0 +1,176 @@
+"""
+Bounded state for the options flow monitors (N03, N08, N09).
+
+The monitors diff the volume of every option contract between two polls
+and keep the largest fills of the session. Both pieces of state are
+bounded here, so a long session over hundreds of tickers costs the same
+memory and CPU per poll as a short one:
+
+    largest = TopN(20, key=lambda fill: fill['cost'])      # or GroupedTopN(20, key, group) per stock
+    volumes = ContractVolumes()
+
+    diff = volumes.update(raw['contractSymbol'], raw['volume'], raw['expiration'])
+    if diff:
+        largest.push(option_fill(stock, price, 'Calls', now, raw, diff))
+    volumes.evict(now)   # drop the expired contracts
+
+TopN keeps a min-heap of n fills, a fill that doesn't beat the smallest
+one is dropped in O(1) and one that does replaces it in O(log n).
+ContractVolumes keeps the largest volume of the session of every live
+contract and indexes the contracts by expiration, eviction only touches
+the expired ones.
+"""
+from collections import OrderedDict
+from datetime import datetime as dt
+from itertools import count
+import heapq
+
+DAY = 24 * 60 * 60
+
+
+class TopN:
+    """
+    The n items with the largest keys pushed so far, largest first when iterated
+    """
+
+    def __init__(self, n, key):
+        self.n = n
+        self.key = key
+        self.heap = []  # (key, order, item), the smallest kept item first
+        self.order = count()
+
+    def push(self, item):
+        """
+        Returns whether the item is kept
+        """
+        entry = (self.key(item), next(self.order), item)
+        if len(self.heap) < self.n:
+            heapq.heappush(self.heap, entry)
+            return True
+        if entry[0] > self.heap[0][0]:
+            heapq.heapreplace(self.heap, entry)
+            return True
+        return False
+
+    def total(self):
+        return sum(entry[0] for entry in self.heap)
+
+    def clear(self):
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return (entry[2] for entry in sorted(self.heap, key=lambda entry: (-entry[0], entry[1])))
+
+
+class GroupedTopN:
+    """
+    A TopN per group, e.g. the largest fills of every stock
+    """
+
+    def __init__(self, n, key, group):
+        self.n = n
+        self.key = key
+        self.group = group
+        self.tops = {}
+
+    def push(self, item):
+        name = self.group(item)
+        top = self.tops.get(name)
+        if top is None:
+            top = self.tops[name] = TopN(self.n, self.key)
+        return top.push(item)
+
+    def groups(self):
+        """
+        The items of every group largest first, the groups by the sum of their keys, largest first
+        """
+        ranked = sorted(self.tops.items(), key=lambda group: group[1].total(), reverse=True)
+        return OrderedDict((name, list(top)) for name, top in ranked)
+
+    def clear(self):
+        self.tops = {}
+
+    def __len__(self):
+        return sum(len(top) for top in self.tops.values())
+
+
+class ContractVolumes:
+    """
+    The largest volume seen of every option contract in the session, by contract symbol.
+    The volumes are day volumes, clear() them on a new session
+    """
+
+    def __init__(self):
+        self.volumes = {}
+        self.expirations = {}  # expiration timestamp -> contract symbols
+
+    def update(self, contract, volume, expiration):
+        """
+        Returns the increase of the volume since the largest one seen, None for a new contract.
+        A lower volume (a stale or lagging response) is ignored and its change is 0
+        """
+        previous = self.volumes.get(contract)
+        if previous is None:
+            self.volumes[contract] = volume
+            self.expirations.setdefault(expiration, set()).add(contract)
+            return None
+        if volume <= previous:
+            return 0
+        self.volumes[contract] = volume
+        return volume - previous
+
+    def evict(self, now):
+        """
+        Drops the contracts expired before `now` (a datetime or a timestamp), returns their number.
+        A contract expires at the end of its expiration day
+        """
+        now = now.timestamp() if isinstance(now, dt) else now
+        evicted = 0
+        for expiration in [e for e in self.expirations if e + DAY <= now]:
+            for contract in self.expirations.pop(expiration):
+                del self.volumes[contract]
+                evicted += 1
+        return evicted
+
+    def clear(self):
+        self.volumes = {}
+        self.expirations = {}
+
+    def __len__(self):
+        return len(self.volumes)
+
+    def __contains__(self, contract):
+        return contract in self.volumes
+
+
+def option_fill(stock, price, option_type, time, raw, volume_diff, **extra):
+    """
+    The table row of a volume change of a contract, `raw` is the contract of the yahoo options response
+    """
+    last_price = raw['lastPrice']
+    strike = raw['strike']
+    ask = raw['ask']
+    bid = raw['bid']
+    return dict(
+        stock=stock,
+        price=price,
+        type=option_type,
+        time=time,
+        expiration=dt.fromtimestamp(raw['expiration']),
+        strike=strike,
+        contact=raw['contractSymbol'],
+        last_price=last_price,
+        bid=bid,
+        ask=ask,
+        volume=raw['volume'],
+        open_interest=raw['openInterest'],
+        implied_volatility=raw['impliedVolatility'],
+        volume_diff=volume_diff,
+        cost=volume_diff * 100 * last_price,
+        strike_div_price=(strike / price - 1) * 100,
+        last_price_position="{:.0f}".format((1 - (ask - last_price) / (ask - bid)) * 100) if ask != bid else None,
+        **extra
+    )
@@ -0,0 +1,294 @@
+"""
+Indicators over a symbols x days panel, computed for all the symbols at once.
+
+The OHLCV bars of the symbols are laid out as one 2-D array per field,
+a row per symbol on the union of the dates, NaN where a symbol has no bar.
+The rolling features are computed on the whole arrays and the Wilder
+smoothed ones (RSI, +DI, -DI, ADX) step over the days with every
+symbol in the step, so there is no per-symbol Python work. They run on
+the rows packed on their own bars, so the values are the ones of each
+symbol's own frame: a symbol listed later starts its lookback at its
+first bar, and a day it has no bar (a halt, a gap in the data) is skipped.
+
+    panel = Panel.from_frames(get_data_many(symbols, start, end))
+    wide = compute(panel)      # days x (indicator, symbol)
+    wide["RSI"]["AAPL"]
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+PRICE_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+PERIOD = 14
+EPSILON = 1e-8  # talib's zero
+
+
+class Panel:
+
+    def __init__(self, symbols, dates, fields):
+        self.symbols = list(symbols)
+        self.dates = pd.Index(dates, name="Date")
+        self.fields = fields  # name -> symbols x days array
+
+    @classmethod
+    def from_frames(cls, frames, fields=PRICE_FIELDS):
+        """
+        A panel of the {symbol: bars} frames, e.g. from market_data.get_data_many
+        """
+        symbols = sorted(frames)
+        dates = sorted(set().union(*(frames[symbol].index for symbol in symbols))) if symbols else []
+        data = np.full((len(fields), len(symbols), len(dates)), np.nan)
+        for row, symbol in enumerate(symbols):
+            df = frames[symbol].reindex(dates)
+            data[:, row, :] = df[fields].to_numpy(dtype=float).T
+        return cls(symbols, dates, dict(zip(fields, data)))
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def __setitem__(self, field, values):
+        self.fields[field] = values
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def to_frame(self, fields=None):
+        """
+        The fields as one wide frame, days x (field, symbol)
+        """
+        fields = list(self.fields) if fields is None else fields
+        return pd.concat({field: pd.DataFrame(self.fields[field].T, index=self.dates, columns=self.symbols)
+                          for field in fields}, axis=1)
+
+
+def shift(x, periods=1):
+    """
+    The values `periods` days before, NaN for the first days
+    """
+    out = np.full_like(x, np.nan, dtype=float)
+    if periods < x.shape[-1]:
+        out[:, periods:] = x[:, :x.shape[-1] - periods]
+    return out
+
+
+def rolling_sum(x, window):
+    """
+    Sums of the last `window` days, NaN if the window has a NaN or isn't full
+    """
+    out = np.full_like(x, np.nan, dtype=float)
+    if window > x.shape[-1]:
+        return out
+    valid = ~np.isnan(x)
+    totals = np.cumsum(np.where(valid, x, 0), axis=-1)
+    counts = np.cumsum(valid, axis=-1)
+    totals = np.concatenate([np.zeros((x.shape[0], 1)), totals], axis=-1)
+    counts = np.concatenate([np.zeros((x.shape[0], 1), dtype=counts.dtype), counts], axis=-1)
+    sums = totals[:, window:] - totals[:, :-window]
+    full = (counts[:, window:] - counts[:, :-window]) == window
+    out[:, window - 1:] = np.where(full, sums, np.nan)
+    return out
+
+
+def rolling_mean(x, window):
+    return rolling_sum(x, window) / window
+
+
+def rolling_max(x, window):
+    out = np.full_like(x, np.nan, dtype=float)
+    if window <= x.shape[-1]:
+        out[:, window - 1:] = sliding_window_view(x, window, axis=-1).max(axis=-1)
+    return out
+
+
+def valid_days(*arrays):
+    """
+    The days every array has a value, i.e. the bars of every row
+    """
+    return np.logical_and.reduce([~np.isnan(x) for x in arrays])
+
+
+def pack(x, valid):
+    """
+    The valid days of every row moved to its start in order, NaN padded at the end
+    """
+    order = np.argsort(~valid, axis=-1, kind="stable")
+    out = np.take_along_axis(x.astype(float), order, axis=-1)
+    out[~np.take_along_axis(valid, order, axis=-1)] = np.nan
+    return out
+
+
+def unpack(x, valid):
+    """
+    The reverse of pack, NaN on the days that aren't valid
+    """
+    order = np.argsort(~valid, axis=-1, kind="stable")
+    out = np.full(x.shape, np.nan)
+    np.put_along_axis(out, order, x, axis=-1)
+    out[~valid] = np.nan
+    return out
+
+
+def over_own_bars(compute):
+    """
+    Runs `compute` on the rows packed on their own bars, the days all the inputs have a value,
+    so a day a symbol has no bar is skipped like in its own frame and doesn't break its windows.
+    The leading NaNs are skipped the same way, like talib does
+    """
+    def wrapper(*args, **kwargs):
+        count = next((i for i, arg in enumerate(args) if np.isscalar(arg)), len(args))
+        arrays = [np.atleast_2d(np.asarray(x, dtype=float)) for x in args[:count]]
+        valid = valid_days(*arrays)
+        if valid.all():
+            return compute(*arrays, *args[count:], **kwargs)
+        results = compute(*(pack(x, valid) for x in arrays), *args[count:], **kwargs)
+        if isinstance(results, tuple):
+            return tuple(unpack(result, valid) for result in results)
+        return unpack(results, valid)
+    wrapper.__name__ = compute.__name__
+    wrapper.__doc__ = compute.__doc__
+    return wrapper
+
+
+@over_own_bars
+def rsi(close, period=PERIOD):
+    """
+    talib RSI, Wilder's smoothing seeded with the average gain and loss of the first `period` changes
+    """
+    out = np.full_like(close, np.nan)
+    if period >= close.shape[-1]:
+        return out
+    # day-major, so every step reads contiguous rows
+    change = np.diff(close, axis=-1).T.copy()
+    gain, loss = np.maximum(change, 0), np.maximum(-change, 0)
+    result = out.T.copy()
+
+    average_gain = gain[:period].mean(axis=0)
+    average_loss = loss[:period].mean(axis=0)
+    for day in range(period, close.shape[-1]):
+        if day > period:
+            average_gain = (average_gain * (period - 1) + gain[day - 1]) / period
+            average_loss = (average_loss * (period - 1) + loss[day - 1]) / period
+        total = average_gain + average_loss
+        result[day] = np.where(np.abs(total) < EPSILON, 0, 100 * average_gain / np.where(total, total, 1))
+    return result.T
+
+
+def directional_movement(high, low, close):
+    """
+    The true range and the +DM, -DM of every day from the second one, talib's definitions
+    """
+    previous_close = close[:, :-1]
+    up, down = high[:, 1:] - high[:, :-1], low[:, :-1] - low[:, 1:]
+    plus_dm = np.where((up > 0) & (up > down), up, 0)
+    minus_dm = np.where((down > 0) & (down > up), down, 0)
+    tr = np.maximum.reduce([high[:, 1:] - low[:, 1:], np.abs(high[:, 1:] - previous_close),
+                            np.abs(low[:, 1:] - previous_close)])
+    return tr, plus_dm, minus_dm
+
+
+@over_own_bars
+def directional(high, low, close, period=PERIOD):
+    """
+    talib PLUS_DI, MINUS_DI and ADX in one pass
+    """
+    days = close.shape[-1]
+    plus_di, minus_di, adx = (np.full((days, close.shape[0]), np.nan) for _ in range(3))
+    if period >= days:
+        return plus_di.T, minus_di.T, adx.T
+    # day-major, so every step reads contiguous rows
+    tr, plus_dm, minus_dm = (x.T.copy() for x in directional_movement(high, low, close))
+
+    # the sums of the first period - 1 days, then Wilder's smoothing from the day `period`
+    smooth_tr = tr[:period - 1].sum(axis=0)
+    smooth_plus = plus_dm[:period - 1].sum(axis=0)
+    smooth_minus = minus_dm[:period - 1].sum(axis=0)
+    dx_sum = np.zeros(close.shape[0])
+    average = None
+    for day in range(period, days):
+        smooth_tr = smooth_tr - smooth_tr / period + tr[day - 1]
+        smooth_plus = smooth_plus - smooth_plus / period + plus_dm[day - 1]
+        smooth_minus = smooth_minus - smooth_minus / period + minus_dm[day - 1]
+
+        has_range = np.abs(smooth_tr) >= EPSILON
+        safe_tr = np.where(has_range, smooth_tr, 1)
+        plus_di[day] = np.where(has_range, 100 * smooth_plus / safe_tr, 0)
+        minus_di[day] = np.where(has_range, 100 * smooth_minus / safe_tr, 0)
+
+        total = plus_di[day] + minus_di[day]
+        has_dx = has_range & (np.abs(total) >= EPSILON)
+        dx = 100 * np.abs(minus_di[day] - plus_di[day]) / np.where(has_dx, total, 1)
+
+        # ADX starts as the mean of the first `period` DX, the days without a DX don't move it
+        if day < 2 * period - 1:
+            dx_sum += np.where(has_dx, dx, 0)
+            continue
+        if average is None:
+            average = (dx_sum + np.where(has_dx, dx, 0)) / period
+        else:
+            average = np.where(has_dx, (average * (period - 1) + dx) / period, average)
+        adx[day] = average
+    return plus_di.T, minus_di.T, adx.T
+
+
+def indicator_suite(panel, period=PERIOD):
+    """
+    RSI, ADX, PLUS_DI and MINUS_DI of every symbol, by name
+    """
+    plus_di, minus_di, adx = directional(panel["High"], panel["Low"], panel["Close"], period=period)
+    return dict(RSI=rsi(panel["Close"], period=period), ADX=adx, PLUS_DI=plus_di, MINUS_DI=minus_di)
+
+
+@over_own_bars
+def gap_columns(open_, close, volume, high_window=89, volume_window=5):
+    """
+    OpeningGap, Recent5daysAvgVolume, VolumeGap, Prev89daysMaxClose and the max close before it
+    """
+    previous_close = shift(close)
+    average_volume = rolling_mean(volume, volume_window)
+    previous_average = shift(average_volume)
+    highest = rolling_max(close, high_window)
+    return ((open_ - previous_close) / previous_close * 100, average_volume,
+            (volume - previous_average) / previous_average, highest, shift(highest))
+
+
+def gap_features(panel, high_window=89, volume_window=5):
+    """
+    The N01 get_pattern_instances columns of every symbol, by name
+    """
+    opening_gap, average_volume, volume_gap, highest, previous_highest = gap_columns(
+        panel["Open"], panel["Close"], panel["Volume"], high_window=high_window, volume_window=volume_window)
+    return dict(
+        OpeningGap=opening_gap,
+        Recent5daysAvgVolume=average_volume,
+        VolumeGap=volume_gap,
+        Prev89daysMaxClose=highest,
+        MaxHigh90Days=panel["Close"] > previous_highest,
+    )
+
+
+def compute(panel, period=PERIOD, high_window=89, volume_window=5):
+    """
+    The bars, the indicator suite and the gap features as one wide frame, days x (column, symbol)
+    """
+    for name, values in indicator_suite(panel, period).items():
+        panel[name] = values
+    for name, values in gap_features(panel, high_window, volume_window).items():
+        panel[name] = values
+    return panel.to_frame()
+
+
+def symbol_frame(wide, symbol):
+    """
+    The columns of one symbol of a wide frame, like the per-symbol notebook frames
+    """
+    return wide.xs(symbol, axis=1, level=1)
+
+
+def add_indicators(df, period=PERIOD):
+    """
+    The indicator suite of one symbol's bars as columns of `df`, like N01.get_data adds them
+    """
+    panel = Panel(["symbol"], df.index, {field: df[field].to_numpy(dtype=float)[None] for field in PRICE_FIELDS})
+    for name, values in indicator_suite(panel, period).items():
+        df[name] = values[0]
+    return df
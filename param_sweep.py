@@ -0,0 +1,216 @@
+"""
+Parameter sweeps of the strategy notebooks over a symbol universe.
+
+The daily bars of the universe, and the indicators the gap pattern needs
+computed over the whole panel, are saved once as a fields x days x symbols
+array in a .npy file. The sweep workers open it memory-mapped and
+read-only, so the processes share the pages of one file and a task only
+carries its parameters. Every grid point is evaluated on all the symbols
+at once, on days x symbols frames.
+
+    build_dataset(symbols, start, end)           # sweep_data/prices.npy + meta.json
+    results = run_sweep("gap", param_grid(opening_gap=[2, 3, 4], rsi=[60, 70]))
+    results = run_sweep("signals", param_grid(ao_fast=[3, 5], vi_period=[10, 14, 21]))
+
+or from the shell:
+    python param_sweep.py --build n13_symbols.csv --days 730
+    python param_sweep.py gap --grid '{"opening_gap": [2, 3, 4], "high_window": [60, 89]}'
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import product
+import argparse
+import logging
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import backtest
+from market_data import get_data_many
+from panel_indicators import Panel, gap_features, indicator_suite, pack
+
+logger = logging.getLogger(__name__)
+
+SWEEP_DIR = "sweep_data"
+PRICE_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+INDICATOR_FIELDS = ["RSI", "ADX", "PLUS_DI", "MINUS_DI"]
+FIELDS = PRICE_FIELDS + INDICATOR_FIELDS
+INDICATOR_PERIOD = 14
+CHUNK_SIZE = 10  # grid points per task
+
+# the N01_TradingGapStrategy thresholds, hold_days is the measuring window
+GAP_DEFAULTS = dict(opening_gap=3, volume_gap=0.5, rsi=70, high_window=89, volume_window=5, hold_days=50)
+# the history_strategies windows
+SIGNAL_DEFAULTS = dict(close_window=backtest.CLOSE_WINDOW, ao_fast=backtest.AO_FAST, ao_slow=backtest.AO_SLOW,
+                       ao_mean=backtest.AO_MEAN, vi_period=backtest.VI_PERIOD)
+
+
+def param_grid(**values):
+    """
+    Every combination of the given parameter values, e.g. param_grid(rsi=[60, 70], opening_gap=[2, 3])
+    """
+    names = list(values)
+    return [dict(zip(names, point)) for point in product(*(values[name] for name in names))]
+
+
+def build_dataset(symbols, start, end, root=SWEEP_DIR):
+    """
+    Fetches the daily bars of the symbols and saves them with their indicators,
+    the days a symbol didn't trade are NaN. Returns the number of symbols saved
+    """
+    panel = Panel.from_frames(get_data_many(symbols, start, end), PRICE_FIELDS)
+    if not len(panel):
+        raise ValueError("No data for the symbols")
+    for name, values in indicator_suite(panel, INDICATOR_PERIOD).items():
+        panel[name] = values
+    data = np.stack([panel[field].T for field in FIELDS])
+
+    os.makedirs(root, exist_ok=True)
+    np.save(os.path.join(root, "prices.npy"), data)
+    with open(os.path.join(root, "meta.json"), "w") as f:
+        json.dump(dict(fields=FIELDS, symbols=panel.symbols, dates=[str(d) for d in panel.dates]), f)
+    return len(panel)
+
+
+class Dataset:
+
+    def __init__(self, root=SWEEP_DIR):
+        with open(os.path.join(root, "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.fields = meta["fields"]
+        self.symbols = meta["symbols"]
+        self.dates = pd.Index(pd.to_datetime(meta["dates"]), name="Date")
+        self.data = np.load(os.path.join(root, "prices.npy"), mmap_mode="r")
+
+    def __getitem__(self, field):
+        """
+        The days x symbols frame of a field, a view of the mapped file
+        """
+        return pd.DataFrame(self.data[self.fields.index(field)], index=self.dates, columns=self.symbols,
+                            copy=False)
+
+
+def gap_point(dataset, opening_gap, volume_gap, rsi, high_window, volume_window, hold_days):
+    """
+    get_pattern_instances of N01 with the given thresholds on all the symbols,
+    and the returns of the instances from the gap day open to the close `hold_days` bars later.
+    The days are the own bars of every symbol, the days it didn't trade are skipped
+    """
+    bars = ~np.isnan(dataset["Close"].to_numpy().T)
+    fields = {field: pack(dataset[field].to_numpy().T, bars)
+              for field in ("Open", "Close", "Volume", "RSI", "PLUS_DI", "MINUS_DI")}
+    gap = gap_features(Panel(dataset.symbols, range(bars.shape[-1]), fields), high_window, volume_window)
+
+    instances = (gap["MaxHigh90Days"] & (gap["VolumeGap"] > volume_gap) & (gap["OpeningGap"] >= opening_gap)
+                 & (fields["RSI"] > rsi) & (fields["PLUS_DI"] > fields["MINUS_DI"]))
+
+    rows, days = np.nonzero(instances)
+    last = days + hold_days - 1
+    complete = last < bars.sum(axis=-1)[rows]
+    returns = (fields["Close"][rows[complete], last[complete]]
+               / fields["Open"][rows[complete], days[complete]] - 1) * 100
+    returns = returns[~np.isnan(returns)]
+    return dict(
+        instances=len(days),
+        measured=len(returns),
+        avg_return=returns.mean() if len(returns) else np.nan,
+        median_return=np.median(returns) if len(returns) else np.nan,
+        win_rate=(returns > 0).mean() * 100 if len(returns) else np.nan,
+    )
+
+
+def signals_point(dataset, strategies=backtest.STRATEGIES, **params):
+    """
+    The history_strategies backtest with the given windows on all the symbols,
+    a result per strategy combination
+    """
+    close = dataset["Close"]
+    signals = backtest.strategy_signals(dataset["High"], dataset["Low"], close, **params)
+    close = close.to_numpy().T  # symbols x days
+    first_close = pd.DataFrame(close).bfill(axis=1).to_numpy()[:, 0]
+
+    results = []
+    for strats in backtest.strategy_combinations(strategies):
+        buy = np.logical_and.reduce([signals["buy_" + s].to_numpy(dtype=bool).T for s in strats])
+        sell = np.logical_and.reduce([signals["sell_" + s].to_numpy(dtype=bool).T for s in strats])
+        entry, exit, profit = backtest.run(close, buy, sell)
+        entry_price = np.take_along_axis(close, backtest.forward_fill_index(entry), axis=-1)
+        trades = exit.sum()
+        results.append(dict(
+            strategies=" ".join(strats),
+            avg_profit_pct=np.nanmean(profit[:, -1] / first_close * 100),
+            trades=trades,
+            win_rate=(exit & (close > entry_price)).sum() / trades * 100 if trades else np.nan,
+        ))
+    return results
+
+
+SWEEPS = {
+    "gap": (gap_point, GAP_DEFAULTS, "avg_return"),
+    "signals": (signals_point, SIGNAL_DEFAULTS, "avg_profit_pct"),
+}
+
+_dataset = None
+
+
+def _open_dataset(root):
+    global _dataset
+    _dataset = Dataset(root)
+
+
+def _run_points(kind, points):
+    evaluate = SWEEPS[kind][0]
+    rows = []
+    for params in points:
+        try:
+            results = evaluate(_dataset, **params)
+        except Exception as e:
+            logger.error("{}: {}".format(params, e))
+            continue
+        for result in (results if isinstance(results, list) else [results]):
+            rows.append(dict(params, **result))
+    return rows
+
+
+def run_sweep(kind, grid, root=SWEEP_DIR, max_workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Evaluates the grid points, the missing parameters take the notebook values,
+    on a process pool over the dataset. Returns the results, best first
+    """
+    _, defaults, rank_by = SWEEPS[kind]
+    points = [dict(defaults, **params) for params in grid]
+    chunks = [points[i:i + chunk_size] for i in range(0, len(points), chunk_size)]
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_open_dataset, initargs=(root,)) as executor:
+        for chunk_rows in executor.map(_run_points, [kind] * len(chunks), chunks):
+            rows.extend(chunk_rows)
+    if not rows:
+        return pd.DataFrame(columns=list(defaults) + [rank_by])
+    return pd.DataFrame(rows).sort_values(rank_by, ascending=False, na_position="last").reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of the strategy notebooks")
+    parser.add_argument("kind", nargs="?", choices=sorted(SWEEPS))
+    parser.add_argument("--grid", default="{}", help="json of the parameter values, e.g. '{\"rsi\": [60, 70]}'")
+    parser.add_argument("--build", metavar="SYMBOLS_CSV", help="build the dataset of the symbols first")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--root", default=SWEEP_DIR)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.build:
+        symbols = pd.read_csv(args.build, header=None)[0].tolist()
+        end = datetime.now()
+        print("{} symbols saved".format(build_dataset(symbols, end - timedelta(days=args.days), end, args.root)))
+    if args.kind:
+        results = run_sweep(args.kind, param_grid(**json.loads(args.grid)), args.root, args.workers)
+        print(results.head(args.top).to_string())
+
+
+if __name__ == "__main__":
+    main()
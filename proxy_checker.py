@@ -0,0 +1,129 @@
+"""
+Checks the proxy lists concurrently.
+
+Every proxy requests the probe page once; the ones that answer with a
+page where the time-sales table parses, with the time slice of the probe
+selected, are written, fastest first, to the file stock_scraper.get_proxies reads.
+
+    python proxy_checker.py proxies.csv proxies2.csv proxies3.csv --report proxies_report.csv
+"""
+from time import monotonic
+import argparse
+import asyncio
+import csv
+
+import aiohttp
+
+from stock_scraper import TRADES_URL, TradesPageParser
+
+PROXY_FILES = ["proxies.csv", "proxies2.csv", "proxies3.csv", "approved_proxies.csv"]
+OUTPUT_FILE = "proxies_approved.csv"
+PROBE_TIME = 1
+PROBE_URL = TRADES_URL.format(symbol="AAPL", time=PROBE_TIME, pageno=1)
+CONCURRENCY = 500
+TIMEOUT = 6
+
+
+def read_proxies(file_names):
+    """
+    Returns the proxies from all the files without duplicates, in the order they appear
+    """
+    proxies = {}
+    for file_name in file_names:
+        with open(file_name, "r") as f:
+            for proxy in f.read().split():
+                proxies[proxy] = None
+    return list(proxies)
+
+
+async def check_proxy(session, semaphore, proxy, url, parse=True, time=PROBE_TIME):
+    """
+    Returns (proxy, status, latency, parses). A page with another time slice
+    than `time` selected (a cached or rewritten page) doesn't parse
+    """
+    async with semaphore:
+        start = monotonic()
+        try:
+            async with session.get(url, proxy="http://{}".format(proxy)) as response:
+                content = await response.read()
+                status = response.status
+        except Exception:
+            return proxy, None, None, False
+        latency = monotonic() - start
+
+    parses = status == 200
+    if parse and parses:
+        parser = TradesPageParser(read_time_range=True)
+        try:
+            parser.feed(content)
+            rows, _ = parser.close()
+            parses = rows is not None and parser.time_range is not None and int(parser.time_range) == time
+        except Exception:
+            parses = False
+    return proxy, status, latency, parses
+
+
+async def check_proxies(proxies, url=PROBE_URL, concurrency=CONCURRENCY, timeout=TIMEOUT, parse=True,
+                        time=PROBE_TIME):
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, force_close=True)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    results = []
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        tasks = [check_proxy(session, semaphore, proxy, url, parse, time) for proxy in proxies]
+        for i, task in enumerate(asyncio.as_completed(tasks), 1):
+            results.append(await task)
+            if i % 500 == 0:
+                print("{}/{} checked, {} approved".format(i, len(proxies), sum(r[3] for r in results)))
+    return rank(results)
+
+
+def rank(results):
+    """
+    The proxies that parse go first, then the faster ones
+    """
+    return sorted(results, key=lambda r: (not r[3], r[2] is None, r[2] or 0))
+
+
+def write_approved(results, file_name=OUTPUT_FILE):
+    approved = [proxy for proxy, _, _, parses in results if parses]
+    with open(file_name, "w") as f:
+        f.write("\n".join(approved))
+    return approved
+
+
+def write_report(results, file_name):
+    with open(file_name, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(["proxy", "status", "latency", "parses"])
+        for proxy, status, latency, parses in results:
+            writer.writerow([proxy, status or "", "" if latency is None else "{:.3f}".format(latency), int(parses)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the proxies against a probe page")
+    parser.add_argument("files", nargs="*", default=PROXY_FILES, help="files with a proxy per line")
+    parser.add_argument("--url", default=PROBE_URL, help="probe page")
+    parser.add_argument("--time", type=int, default=PROBE_TIME, help="the time slice of the probe page")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help="seconds per probe")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="ranked approved proxies")
+    parser.add_argument("--report", help="csv with the status and latency of every proxy")
+    parser.add_argument("--no-parse", action="store_true",
+                        help="approve any 200 response, without looking for the time-sales table")
+    args = parser.parse_args()
+
+    proxies = read_proxies(args.files)
+    print("{} proxies to check".format(len(proxies)))
+    start = monotonic()
+    results = asyncio.run(check_proxies(proxies, args.url, args.concurrency, args.timeout, not args.no_parse,
+                                        args.time))
+    approved = write_approved(results, args.output)
+    if args.report:
+        write_report(results, args.report)
+    print("{} approved in {:.0f}s".format(len(approved), monotonic() - start))
+
+
+if __name__ == "__main__":
+    main()
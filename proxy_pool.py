@@ -0,0 +1,135 @@
+"""
+Health-scored proxy pool.
+
+Every proxy has an EWMA of its latency and of its success rate. A failed
+proxy is put in a cooldown that doubles with each consecutive failure,
+instead of being thrown away, and comes back once the cooldown is over.
+acquire hands out the healthy proxy with the best score, where the score
+also counts the requests already in flight through the proxy, so the
+workers spread over the fast proxies instead of piling onto one.
+The scores are saved in a json file and loaded on the next run.
+"""
+from time import time as now
+import threading
+import logging
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+PROXY_SCORES_FILE = "proxy_scores.json"
+EWMA_ALPHA = 0.3
+INITIAL_LATENCY = 3.0  # seconds, optimistic for the proxies we know nothing about
+MIN_SUCCESS = 0.05
+COOLDOWN = 30  # seconds after the first failure
+MAX_COOLDOWN = 30 * 60
+
+
+class ProxyStats:
+
+    def __init__(self, latency=INITIAL_LATENCY, success=1.0, failures=0, cooldown_until=0):
+        self.latency = latency
+        self.success = success
+        self.failures = failures  # consecutive ones
+        self.cooldown_until = cooldown_until
+        self.in_flight = 0
+
+    @property
+    def score(self):
+        """
+        Expected seconds per successful request, lower is better
+        """
+        return self.latency * (1 + self.in_flight) / max(self.success, MIN_SUCCESS)
+
+    def to_dict(self):
+        return dict(latency=self.latency, success=self.success,
+                    failures=self.failures, cooldown_until=self.cooldown_until)
+
+
+class ProxyPool:
+
+    def __init__(self, proxies, scores_file=PROXY_SCORES_FILE, alpha=EWMA_ALPHA,
+                 cooldown=COOLDOWN, max_cooldown=MAX_COOLDOWN):
+        self.scores_file = scores_file
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.condition = threading.Condition()
+        self.stats = {proxy: ProxyStats() for proxy in proxies}
+        if scores_file:
+            self.load()
+
+    def __len__(self):
+        return len(self.stats)
+
+    def load(self):
+        if not os.path.exists(self.scores_file):
+            return
+        with open(self.scores_file, "r") as f:
+            scores = json.load(f)
+        with self.condition:
+            for proxy, stats in self.stats.items():
+                if proxy in scores:
+                    self.stats[proxy] = ProxyStats(**scores[proxy])
+
+    def save(self):
+        with self.condition:
+            scores = {proxy: stats.to_dict() for proxy, stats in self.stats.items()}
+        tmp_file = self.scores_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(scores, f)
+        os.replace(tmp_file, self.scores_file)
+
+    def _best(self):
+        current_time = now()
+        healthy = [(stats.score, proxy) for proxy, stats in self.stats.items()
+                   if stats.cooldown_until <= current_time]
+        if healthy:
+            return min(healthy)[1]
+
+    def wait_time(self):
+        """
+        Seconds until the first proxy leaves its cooldown
+        """
+        with self.condition:
+            if not self.stats:
+                return None
+            return max(min(s.cooldown_until for s in self.stats.values()) - now(), 0)
+
+    def acquire(self, wait=True):
+        """
+        Returns the best healthy proxy.
+        If all of them are cooling down, waits for the first one to recover,
+        or returns None if `wait` is False
+        """
+        with self.condition:
+            if not self.stats:
+                raise ValueError("The proxy pool is empty")
+            while True:
+                proxy = self._best()
+                if proxy is not None:
+                    self.stats[proxy].in_flight += 1
+                    return proxy
+                if not wait:
+                    return None
+                first_ready = min(s.cooldown_until for s in self.stats.values())
+                self.condition.wait(max(first_ready - now(), 0.1))
+
+    def report_success(self, proxy, latency):
+        with self.condition:
+            stats = self.stats[proxy]
+            stats.in_flight = max(stats.in_flight - 1, 0)
+            stats.latency += self.alpha * (latency - stats.latency)
+            stats.success += self.alpha * (1 - stats.success)
+            stats.failures = 0
+            self.condition.notify()
+
+    def report_failure(self, proxy):
+        with self.condition:
+            stats = self.stats[proxy]
+            stats.in_flight = max(stats.in_flight - 1, 0)
+            stats.success -= self.alpha * stats.success
+            stats.failures += 1
+            cooldown = min(self.cooldown * 2 ** (stats.failures - 1), self.max_cooldown)
+            stats.cooldown_until = now() + cooldown
+            logger.info("Proxy {} cools down for {}s".format(proxy, cooldown))
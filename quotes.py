@@ -0,0 +1,79 @@
+"""
+Batched quotes for screening the whole symbol list.
+
+The yahoo quote endpoint takes many symbols per request, so a universe of
+a few thousand symbols is a couple dozen requests, sent in parallel. The
+numeric fields go straight into a preallocated symbols x fields array.
+
+    quotes = get_quotes(symbols)
+    df = open_by_close(quotes)
+    df[df.OpenByClose <= -5]
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+import numpy as np
+import pandas as pd
+
+import http_pool
+
+logger = logging.getLogger(__name__)
+
+QUOTE_URL = "https://query1.finance.yahoo.com/v7/finance/quote?symbols={symbols}&fields={fields}"
+BATCH_SIZE = 200
+MAX_WORKERS = 10
+TIMEOUT = 10
+FIELDS = (
+    "regularMarketOpen",
+    "regularMarketPreviousClose",
+    "regularMarketPrice",
+    "regularMarketDayHigh",
+    "regularMarketDayLow",
+    "regularMarketVolume",
+)
+
+
+def fetch_batch(symbols, fields=FIELDS):
+    url = QUOTE_URL.format(symbols=",".join(symbols), fields=",".join(fields))
+    try:
+        response = http_pool.get(url, timeout=TIMEOUT)
+        return response.json()['quoteResponse']['result']
+    except Exception as e:
+        logger.error("Failed to get the quotes of {}..: {}".format(symbols[0], e))
+        return []
+
+
+def get_quotes(symbols, fields=FIELDS, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
+    """
+    Returns a frame with a row per symbol and a column per field,
+    NaN for the symbols and fields that were not received
+    """
+    symbols = list(dict.fromkeys(symbols))
+    rows = {symbol: i for i, symbol in enumerate(symbols)}
+    values = np.full((len(symbols), len(fields)), np.nan)
+
+    batches = [symbols[i:i + batch_size] for i in range(0, len(symbols), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for quotes in executor.map(lambda batch: fetch_batch(batch, fields), batches):
+            for quote in quotes:
+                row = rows.get(quote.get('symbol'))
+                if row is None:
+                    continue
+                for column, field in enumerate(fields):
+                    value = quote.get(field)
+                    if isinstance(value, (int, float)):
+                        values[row, column] = value
+
+    return pd.DataFrame(values, index=pd.Index(symbols, name='symbol'), columns=list(fields))
+
+
+def open_by_close(quotes):
+    """
+    Open, PrevClose and the OpenByClose gap in % of the symbols that have both prices
+    """
+    df = pd.DataFrame(dict(
+        Open=quotes['regularMarketOpen'],
+        PrevClose=quotes['regularMarketPreviousClose'],
+    )).dropna()
+    df['OpenByClose'] = (df.Open / df.PrevClose - 1) * 100
+    return df
@@ -0,0 +1,108 @@
+"""
+Journal of an end-of-day scrape run, so a restarted run skips the finished work.
+
+For every date there is a directory with an append-only journal.jsonl:
+    {"event": "slice", "symbol": "AAPL", "time": 3}   the time slice rows are saved
+    {"event": "done", "symbol": "AAPL"}              the symbol result is saved
+    {"event": "failed", "symbol": "AAPL", "error": "..."}
+and the trade rows of the finished time slices in slices/<symbol>_<time>.json.
+A symbol that failed `max_failures` times is dead-lettered: it's skipped
+and listed in dead_letters.txt.
+"""
+from datetime import datetime
+import threading
+import logging
+import json
+import os
+
+from storage import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DIR = os.path.join(DATA_DIR, ".journal")
+MAX_FAILURES = 3
+
+
+class RunJournal:
+
+    def __init__(self, date, root=JOURNAL_DIR, max_failures=MAX_FAILURES):
+        self.dir = os.path.join(root, str(date))
+        self.slices_dir = os.path.join(self.dir, "slices")
+        self.path = os.path.join(self.dir, "journal.jsonl")
+        self.max_failures = max_failures
+        self.lock = threading.Lock()
+        self.done = set()
+        self.slices = set()  # (symbol, time)
+        self.failures = {}
+        os.makedirs(self.slices_dir, exist_ok=True)
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:  # the last line of a killed run
+                    continue
+                self._apply(record)
+
+    def _apply(self, record):
+        event, symbol = record["event"], record["symbol"]
+        if event == "slice":
+            self.slices.add((symbol, record["time"]))
+        elif event == "done":
+            self.done.add(symbol)
+        elif event == "failed":
+            self.failures[symbol] = self.failures.get(symbol, 0) + 1
+
+    def _write(self, **record):
+        record["at"] = datetime.now().isoformat()
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            self._apply(record)
+
+    def is_done(self, symbol):
+        return symbol in self.done
+
+    def is_dead(self, symbol):
+        return self.failures.get(symbol, 0) >= self.max_failures
+
+    def should_skip(self, symbol):
+        return self.is_done(symbol) or self.is_dead(symbol)
+
+    def slice_path(self, symbol, time):
+        return os.path.join(self.slices_dir, "{}_{}.json".format(symbol, time))
+
+    def is_slice_done(self, symbol, time):
+        return (symbol, time) in self.slices
+
+    def save_slice(self, symbol, time, rows):
+        path = self.slice_path(symbol, time)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(rows, f)
+        os.replace(tmp_path, path)
+        self._write(event="slice", symbol=symbol, time=time)
+
+    def load_slice(self, symbol, time):
+        with open(self.slice_path(symbol, time), "r") as f:
+            return [tuple(row) for row in json.load(f)]
+
+    def mark_done(self, symbol):
+        self._write(event="done", symbol=symbol)
+
+    def mark_failed(self, symbol, error):
+        self._write(event="failed", symbol=symbol, error=str(error))
+        if self.is_dead(symbol):
+            logger.error("{} failed {} times, it's dead-lettered".format(symbol, self.max_failures))
+            self.save_dead_letters()
+
+    def dead_letters(self):
+        return sorted(symbol for symbol in self.failures if self.is_dead(symbol))
+
+    def save_dead_letters(self):
+        with open(os.path.join(self.dir, "dead_letters.txt"), "w") as f:
+            f.write("\n".join(self.dead_letters()))
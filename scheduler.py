@@ -0,0 +1,228 @@
+"""
+Minute-aligned polling for the live monitor notebooks.
+
+WorkerPool keeps its threads for the whole session instead of starting and
+joining hundreds of them every minute:
+
+    pool = WorkerPool(100)
+    results = pool.map(get_minute_data, symbols, now)   # [(symbol, result), ...]
+    r = pool.run_queue(get_transactions, [(stock,) for stock in stocks])
+
+run_queue runs the notebooks' queue workers, func(q, r, *args): q.put(args)
+queues one more task of the same cycle (e.g. another expiration date) and
+r collects the results, it returns when all the tasks of the cycle are done.
+
+MinuteScheduler calls a job on the wall-clock minute boundaries:
+
+    scheduler = MinuteScheduler(job, active=market_hours)
+    scheduler.run()   # job(now) at hh:mm:00, hh:mm+1:00, ...
+
+A cycle that overruns the next boundary doesn't pile up: with
+overlap="skip" the missed boundaries are dropped and the next cycle starts
+on the next boundary, with overlap="merge" one catch-up cycle starts right
+away. Every cycle is measured (lag behind its boundary, duration, missed
+boundaries) and scheduler.stats() summarizes the recent ones.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, namedtuple
+from datetime import datetime
+import threading
+import logging
+import queue
+import math
+import time
+
+import numpy as np
+import pytz
+
+logger = logging.getLogger(__name__)
+
+MARKET_TIMEZONE = pytz.timezone("US/Eastern")
+INTERVAL = 60
+HISTORY = 500  # cycles kept for the stats
+
+CycleStats = namedtuple("CycleStats", "scheduled started lag duration missed error")
+
+
+class Cycle:
+    """
+    The tasks of one run_queue call, `put` is the queue.put of the notebook workers
+    """
+
+    def __init__(self, pool, func):
+        self.pool = pool
+        self.func = func
+        self.results = queue.Queue()
+        self.pending = 0
+        self.done = threading.Condition()
+
+    def put(self, args, block=True, timeout=None):
+        with self.done:
+            self.pending += 1
+        self.pool.executor.submit(self._run, args)
+
+    def _run(self, args):
+        try:
+            self.func(self, self.results, *args)
+        except Exception as e:
+            logger.error("{}{}: {}".format(getattr(self.func, "__name__", "task"), args, e))
+        finally:
+            with self.done:
+                self.pending -= 1
+                if not self.pending:
+                    self.done.notify_all()
+
+    def join(self):
+        with self.done:
+            while self.pending:
+                self.done.wait()
+
+
+class WorkerPool:
+
+    def __init__(self, max_workers=100):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def map(self, func, items, *args):
+        """
+        [(item, func(item, *args))] of the items whose result isn't None, the errors are logged
+        """
+        def call(item):
+            try:
+                return item, func(item, *args)
+            except Exception as e:
+                logger.error("{}: {}".format(item, e))
+                return item, None
+        return [(item, result) for item, result in self.executor.map(call, items) if result is not None]
+
+    def run_queue(self, func, tasks):
+        """
+        Runs func(q, r, *task) for the tasks and the ones they put on q, returns r
+        """
+        cycle = Cycle(self, func)
+        for task in tasks:
+            cycle.put(task)
+        cycle.join()
+        return cycle.results
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def market_hours(now, open_time=(9, 30), close_time=(16, 0)):
+    """
+    Whether the regular session is open at `now`, any timezone
+    """
+    now = now.astimezone(MARKET_TIMEZONE)
+    if now.isoweekday() > 5:
+        return False
+    start = now.replace(hour=open_time[0], minute=open_time[1], second=0, microsecond=0)
+    stop = now.replace(hour=close_time[0], minute=close_time[1], second=0, microsecond=0)
+    return start <= now <= stop
+
+
+class MinuteScheduler:
+
+    def __init__(self, job, interval=INTERVAL, offset=0, active=None, overlap="skip", tz=None):
+        """
+        job(now) runs at every `interval` seconds boundary plus `offset` seconds,
+        if `active(now)` (always by default). `now` is in `tz`, local by default
+        """
+        if overlap not in ("skip", "merge"):
+            raise ValueError("overlap is 'skip' or 'merge'")
+        self.job = job
+        self.interval = interval
+        self.offset = offset
+        self.active = active
+        self.overlap = overlap
+        self.tz = tz
+        self.history = deque(maxlen=HISTORY)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def next_boundary(self, after):
+        # the tolerance keeps a boundary computed from a float interval on its own index
+        return (math.floor((after - self.offset) / self.interval + 1e-9) + 1) * self.interval + self.offset
+
+    def now(self, timestamp):
+        return datetime.fromtimestamp(timestamp, tz=self.tz) if self.tz else datetime.fromtimestamp(timestamp)
+
+    def run_cycle(self, scheduled):
+        started = time.time()
+        error = None
+        try:
+            self.job(self.now(scheduled))
+        except Exception as e:
+            error = repr(e)
+            logger.exception("The cycle of {} failed".format(self.now(scheduled)))
+        stats = CycleStats(self.now(scheduled), self.now(started), started - scheduled,
+                           time.time() - started, 0, error)
+        self.history.append(stats)
+        return stats
+
+    def run(self, max_cycles=None):
+        """
+        Runs the cycles until stop() or `max_cycles` cycles
+        """
+        cycles = 0
+        scheduled = self.next_boundary(time.time())
+        while not self.stopped.is_set() and (max_cycles is None or cycles < max_cycles):
+            if self.stopped.wait(max(scheduled - time.time(), 0)):
+                break
+            if self.active is not None and not self.active(self.now(scheduled)):
+                scheduled = self.next_boundary(time.time())
+                continue
+
+            stats = self.run_cycle(scheduled)
+            cycles += 1
+
+            current = time.time()
+            following = self.next_boundary(scheduled)
+            if current <= following:
+                scheduled = following
+                continue
+            missed = int((current - following) // self.interval) + 1
+            self.history[-1] = stats._replace(missed=missed)
+            logger.warning("The cycle of {} took {:.1f}s, {} boundaries missed".format(
+                stats.scheduled, stats.duration, missed))
+            # merge: the missed boundaries as one cycle right away, skip: wait for the next one
+            scheduled = current if self.overlap == "merge" else self.next_boundary(current)
+
+    def start(self):
+        """
+        Runs the scheduler in a background thread
+        """
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    @property
+    def last(self):
+        return self.history[-1] if self.history else None
+
+    def stats(self):
+        """
+        Durations and lags of the recent cycles in seconds, the overruns and the missed boundaries
+        """
+        if not self.history:
+            return {}
+        durations = np.array([s.duration for s in self.history])
+        lags = np.array([s.lag for s in self.history])
+        return dict(
+            cycles=len(self.history),
+            duration_mean=durations.mean(),
+            duration_p50=np.percentile(durations, 50),
+            duration_p95=np.percentile(durations, 95),
+            duration_max=durations.max(),
+            lag_max=lags.max(),
+            overruns=sum(1 for s in self.history if s.missed),
+            missed=sum(s.missed for s in self.history),
+            errors=sum(1 for s in self.history if s.error),
+        )
@@ -1,9 +1,8 @@
-from urllib.parse import quote_plus, urlparse, parse_qs, urlencode
-from lxml import html
-import re
+from urllib.parse import quote_plus, urlencode
 from datetime import datetime, timedelta
 import pandas as pd
-import requests
+import http_pool
+from stock_scraper import execute_safe, stream_trades_page, trades_to_df
 import pytz
 import csv
 import os
@@ -35,7 +34,7 @@ def get_trading_dates(date):
     url = "https://query1.finance.yahoo.com/v7/finance/chart/X?period1={:.0f}&period2={:.0f}" \
           "&interval=1d&includeTimestamps=true".format((date - timedelta(days=20)).timestamp(),
                                                        date.timestamp())
-    page = requests.get(url)
+    page = http_pool.get(url)
     chart = page.json()['chart']
 
     result = chart['result'][0]
@@ -44,21 +43,6 @@ def get_trading_dates(date):
     return start, end
 
 
-def execute_safe(method, *args, **kwargs):
-    errors = 0
-    while True:
-        try:
-            response = method(*args, **kwargs)
-        except Exception as e:
-            errors += 1
-            logger.error(e)
-            sleep_time = errors * 10
-            logger.info("sleep {}s".format(sleep_time))
-            sleep(sleep_time)
-        else:
-            return response
-
-
 def get_minute_data(symbol, now, timeout=None):
     start = now.replace(hour=9, minute=30, second=0, microsecond=0)
     end = start.replace(hour=16, minute=0)
@@ -66,7 +50,7 @@ def get_minute_data(symbol, now, timeout=None):
           "&interval=1m&indicators=quote&includeTimestamps=true&" \
           "events=div%7Csplit%7Cearn".format(symbol, start.timestamp(), end.timestamp())
 
-    page = execute_safe(requests.get, url, timeout=timeout)
+    page = execute_safe(http_pool.get, url, timeout=timeout)
 
     result = page.json()['chart']['result']
     if not result:
@@ -84,58 +68,18 @@ def get_minute_data(symbol, now, timeout=None):
 def pull_trades(stock, time, pageno=None):
     base_url = "http://www.nasdaq.com/symbol/{symbol}/time-sales?time={time}&pageno={pageno}"
 
-    trades = []
     url = base_url.format(symbol=stock, time=time, pageno=pageno or 1)
-    page_res = requests.get(url)
+    page_res = http_pool.get(url, stream=True)
+    trades, max_page = stream_trades_page(page_res)
+    trades = list(trades or [])
     sleep(2)
-    tree = html.fromstring(page_res.content)
-
-    table = tree.find('.//table[@id="AfterHoursPagingContents_Table"]')
-
-    if table is not None:
-        for row in table:
-            if row.tag == 'tr':
-                trades.append(tuple(col.text_content() for col in row))
 
     if pageno is None:
-        pager = tree.find('.//ul[@id="pager"]')
-        if pager is not None:
-            page_links = pager.findall('.//a')
-            if page_links:
-                href = page_links[-1].attrib['href']
-                parsed_url = urlparse(href)
-                query_params = parse_qs(parsed_url.query)
-                max_page = int(query_params['pageno'][0])
-
-                for pn in range(1, max_page + 1):
-                    res = pull_trades(stock, time, pageno=pn)
-                    trades.extend(res)
+        for pn in range(2, (max_page or 1) + 1):
+            trades.extend(pull_trades(stock, time, pageno=pn))
     return trades
 
 
-def trades_to_df(trades, date):
-    # save resp
-    raw_data = dict(time=[], price=[], volume=[])
-
-    for time, price, volume in trades:
-        time_str = re.sub(r'[^\d:]+', '', time)
-        hour, minute, *_ = time_str.split(':')
-        time = date.replace(hour=int(hour), minute=int(minute))
-        price = float(re.sub(r'[^\d\.]+', '', price))
-        volume = int(re.sub(r'[^\d]+', '', volume))
-
-        raw_data['time'].append(time)
-        raw_data['price'].append(price)
-        raw_data['volume'].append(volume)
-
-    df = pd.DataFrame(raw_data)
-    df = df[df.volume >= 1000]
-    df['cost'] = df.price * df.volume * 100
-    df['trades_count'] = 1
-    df = df.groupby(['time'])['cost', 'volume', 'trades_count'].sum()
-    return df
-
-
 def main():
     today = datetime.now(tz=DATA_TIMEZONE).replace(second=0, microsecond=0)
     print(today)
@@ -173,6 +117,7 @@ def main():
                 result.to_csv(f)
 
         print(datetime.now() - now)
+        print(http_pool.get_stats())
 
 
 if __name__ == "__main__":
@@ -1,14 +1,15 @@
 from urllib.parse import quote_plus, urlparse, parse_qs, urlencode
-from lxml import html
-import re
+from lxml import etree
 from datetime import datetime, timedelta
 import pandas as pd
-import requests
+import http_pool
+from proxy_pool import ProxyPool
+from storage import get_storage
+from run_journal import RunJournal
 import pytz
-import json
 import csv
-import os
 import threading
+import random
 import queue
 import logging
 from time import sleep
@@ -19,7 +20,13 @@ logger = logging.getLogger(__name__)
 STOCKS_FILE_NAME = 'stocks_for_scrapping.csv'
 DATA_TIMEZONE = pytz.timezone("US/Eastern")
 MAX_THREADS = 100
+MAX_PAGE_ATTEMPTS = 30
+RETRY_ATTEMPTS = 8
+RETRY_BASE = 2  # seconds
+RETRY_CAP = 120
+TIME_SLICES = range(1, 14)
 DATA_DIR = "data"
+STORAGE_BACKEND = "csv"  # or "parquet", see storage.py
 
 
 def get_stocks(file_name=None):
@@ -38,7 +45,7 @@ def get_trading_dates(date):
     url = "https://query1.finance.yahoo.com/v7/finance/chart/X?period1={:.0f}&period2={:.0f}" \
           "&interval=1d&includeTimestamps=true".format((date - timedelta(days=20)).timestamp(),
                                                        date.timestamp())
-    page = requests.get(url)
+    page = http_pool.get(url)
     chart = page.json()['chart']
 
     result = chart['result'][0]
@@ -47,7 +54,18 @@ def get_trading_dates(date):
     return start, end
 
 
+def backoff_time(errors):
+    """
+    Capped exponential backoff with full jitter
+    """
+    return random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** errors))
+
+
 def execute_safe(method, *args, **kwargs):
+    """
+    Calls the method until it succeeds, RETRY_ATTEMPTS times at most,
+    the last error is raised then
+    """
     errors = 0
     while True:
         try:
@@ -55,25 +73,36 @@ def execute_safe(method, *args, **kwargs):
         except Exception as e:
             errors += 1
             logger.error(e)
-            sleep_time = errors * 10
-            logger.info("sleep {}s".format(sleep_time))
+            if errors >= RETRY_ATTEMPTS:
+                raise
+            sleep_time = backoff_time(errors)
+            logger.info("sleep {:.1f}s".format(sleep_time))
             sleep(sleep_time)
         else:
             return response
 
 
 def get_minute_data(symbol, now, timeout=None):
+    url = minute_data_url(symbol, now)
+    page = execute_safe(http_pool.get, url, timeout=timeout)
+    return minute_data_to_df(page.json(), now)
+
+
+def minute_data_url(symbol, now):
     start = now.replace(hour=9, minute=30, second=0, microsecond=0)
     end = start.replace(hour=16, minute=0)
-    url = "https://query1.finance.yahoo.com/v7/finance/chart/{}?period1={:.0f}&period2={:.0f}" \
-          "&interval=1m&indicators=quote&includeTimestamps=true&" \
-          "events=div%7Csplit%7Cearn".format(symbol, start.timestamp(), end.timestamp())
+    return "https://query1.finance.yahoo.com/v7/finance/chart/{}?period1={:.0f}&period2={:.0f}" \
+           "&interval=1m&indicators=quote&includeTimestamps=true&" \
+           "events=div%7Csplit%7Cearn".format(symbol, start.timestamp(), end.timestamp())
 
-    page = execute_safe(requests.get, url, timeout=timeout)
 
-    result = page.json()['chart']['result']
+def minute_data_to_df(payload, now):
+    """
+    Builds the minute bars frame from a yahoo chart response
+    """
+    result = payload['chart']['result']
     if not result:
-        print(page.json())
+        print(payload)
         return
     data = result[0]
     quote = data['indicators']['quote'][0]
@@ -96,6 +125,10 @@ class ProxyFailException(Exception):
     pass
 
 
+class SliceFailException(Exception):
+    pass
+
+
 # class TaskFailException(Exception):
 #     pass
 #
@@ -260,73 +293,207 @@ class ProxyFailException(Exception):
 # -- old method
 
 
-def pull_trades(proxy, q, r, stock, time, pageno=None):
-    base_url = "http://www.nasdaq.com/symbol/{symbol}/time-sales?time={time}&pageno={pageno}"
-    url = base_url.format(symbol=stock, time=time, pageno=pageno or 1)
+TRADES_URL = "http://www.nasdaq.com/symbol/{symbol}/time-sales?time={time}&pageno={pageno}"
+
+
+TRADES_TABLE_ID = "AfterHoursPagingContents_Table"
+PAGER_ID = "pager"
+TIME_RANGE_ID = "quotes_content_left_DropDowntimerange"
+CHUNK_SIZE = 16 * 1024
+
+
+class TradesPageParser:
+    """
+    Incremental parser of a time-sales page.
+    Takes the page in chunks as they arrive and keeps only the rows of the trades table
+    and the href of the last pager link, the rest of the elements are dropped once parsed.
+    With `read_time_range` it also reads the time slice selected in the time range dropdown
+    """
+
+    def __init__(self, read_time_range=False):
+        self.parser = etree.HTMLPullParser(events=('start', 'end'))
+        self.rows = None
+        self.table = None
+        self.pager = None
+        self.pager_found = False
+        self.last_href = None
+        self.read_time_range = read_time_range
+        self.select = None
+        self.select_found = False
+        self.time_range = None  # the value of the selected option, the first one if none is selected
+        self.time_range_selected = False
+
+    @property
+    def done(self):
+        """
+        The table and the pager have been read, the rest of the page isn't needed
+        """
+        return (self.rows is not None and self.table is None and self.pager_found and self.pager is None
+                and (self.select_found and self.select is None or not self.read_time_range))
+
+    def feed(self, data):
+        self.parser.feed(data)
+        self._read_events()
+
+    def close(self):
+        """
+        Returns the trade rows and the number of the last page, see parse_trades_page
+        """
+        if not self.done:
+            self.parser.close()
+            self._read_events()
+        return self.rows, self.max_page
+
+    @property
+    def max_page(self):
+        if not self.pager_found:
+            return None
+        if self.last_href is None:
+            return 1
+        query_params = parse_qs(urlparse(self.last_href).query)
+        return int(query_params['pageno'][0])
+
+    def _read_events(self):
+        for event, el in self.parser.read_events():
+            if event == 'start':
+                if el.tag == 'table' and self.rows is None and el.get('id') == TRADES_TABLE_ID:
+                    self.table = el
+                    self.rows = []
+                elif el.tag == 'ul' and not self.pager_found and el.get('id') == PAGER_ID:
+                    self.pager = el
+                    self.pager_found = True
+                elif el.tag == 'select' and not self.select_found and el.get('id') == TIME_RANGE_ID:
+                    self.select = el
+                    self.select_found = True
+                continue
+
+            if self.select is not None:
+                if el is self.select:
+                    self.select = None
+                elif el.tag == 'option' and not self.time_range_selected:
+                    if el.get('selected') is not None:
+                        self.time_range = el.get('value')
+                        self.time_range_selected = True
+                    elif self.time_range is None:
+                        self.time_range = el.get('value')
+
+            if self.table is not None:
+                if el is self.table:
+                    self.table = None
+                    self._drop(el)
+                elif el.tag == 'tr' and el.getparent() is self.table:
+                    self.rows.append(tuple(''.join(col.itertext()) for col in el))
+                    self._drop(el)
+            elif self.pager is not None:
+                if el is self.pager:
+                    self.pager = None
+                    self._drop(el)
+                elif el.tag == 'a':
+                    self.last_href = el.get('href')
+            else:
+                self._drop(el)
+
+    @staticmethod
+    def _drop(el):
+        el.clear()
+        parent = el.getparent()
+        if parent is not None:
+            while el.getprevious() is not None:
+                del parent[0]
+
+
+def parse_trades_page(content):
+    """
+    Returns the trade rows of a time-sales page and the number of its last page
+    rows is None if the trades table is missing, the page number is None if the pager is
+    """
+    parser = TradesPageParser()
+    parser.feed(content)
+    return parser.close()
+
+
+def stream_trades_page(response, parser=None):
+    """
+    parse_trades_page for a requests response opened with stream=True.
+    The rest of the body is still read when the parser is done, so the connection can be reused
+    """
+    parser = parser or TradesPageParser()
+    for chunk in response.iter_content(CHUNK_SIZE):
+        if not parser.done:
+            parser.feed(chunk)
+    return parser.close()
+
+
+def pull_trades(proxy, stock, time, pageno=None):
+    """
+    Returns the trade rows of a time-sales page, the number of the last page
+    of the time slice (for its first page only) and the response time
+    """
+    url = TRADES_URL.format(symbol=stock, time=time, pageno=pageno or 1)
     try:
-        page_res = requests.get(url, timeout=12, proxies={'http': "http://{}".format(proxy)})
-        tree = html.fromstring(page_res.content)
+        page_res = http_pool.get(url, proxy=proxy, timeout=12, stream=True)
+        rows, max_page = stream_trades_page(page_res)
     except Exception as e:
         raise ProxyFailException(e)
-    else:
-        table = tree.find('.//table[@id="AfterHoursPagingContents_Table"]')
-        if table is None:
-            raise ProxyFailException('The table is missing; {}'.format(proxy))
-        else:
-            sleep(5)
-            for row in table:
-                if row.tag == 'tr':
-                    r.put(tuple(col.text_content() for col in row))
-
-        if pageno is None:
-            pager = tree.find('.//ul[@id="pager"]')
-            if pager is not None:
-                page_links = pager.findall('.//a')
-                if page_links:
-                    href = page_links[-1].attrib['href']
-                    parsed_url = urlparse(href)
-                    query_params = parse_qs(parsed_url.query)
-                    max_page = int(query_params['pageno'][0])
-
-                    for pn in range(1, max_page + 1):
-                        q.put((stock, time, pn))
-            else:
-                print('The pager is missing; {}; {}'.format(url, proxy))
 
+    if rows is None:
+        raise ProxyFailException('The table is missing; {}'.format(proxy))
+    sleep(5)
 
-def load_in_parallel(stock, date):
-    tasks = queue.Queue()  # queue with arguments for the 'get_transactions' function
-    responses = queue.Queue()  # queue with raw responses
-    proxies = queue.Queue()
-    for p in get_proxies():
-        proxies.put(p)
+    if pageno is not None:
+        max_page = None
+    elif max_page is None:
+        print('The pager is missing; {}; {}'.format(url, proxy))
+    return rows, max_page, page_res.elapsed.total_seconds()
 
-    def get_proxy():
-        try:
-            proxy = proxies.get_nowait()
-        except queue.Empty:
-            pass
-            print("Error: you have used all the proxies - this worker will stop")
-        else:
-            return proxy
+
+def load_in_parallel(stock, date, proxy_pool=None, journal=None):
+    """
+    Pulls all the time-sales pages of the stock.
+    With a journal every finished time slice is saved to it, and the slices
+    it already has are not pulled again
+    """
+    tasks = queue.Queue()  # queue with arguments for the 'pull_trades' function
+    lock = threading.Lock()
+    slices = {}  # time slice -> trade rows
+    pending = {}  # time slice -> pages not pulled yet
+    failed = set()
+    if proxy_pool is None:
+        proxy_pool = ProxyPool(get_proxies())
+
+    def page_done(time, rows, max_page):
+        with lock:
+            slices[time].extend(rows)
+            for pn in range(2, (max_page or 1) + 1):
+                pending[time] += 1
+                tasks.put((stock, time, pn))
+            pending[time] -= 1
+            slice_done = pending[time] == 0 and time not in failed
+        if slice_done and journal is not None:
+            journal.save_slice(stock, time, slices[time])
 
     def worker():
-        proxy = get_proxy()
-        while proxy is not None:
+        while True:
             args = tasks.get()
             if args is None:
                 break
-            while True:
+            for _ in range(MAX_PAGE_ATTEMPTS):
+                proxy = proxy_pool.acquire()
                 try:
-                    pull_trades(proxy, tasks, responses, *args)
+                    rows, max_page, latency = pull_trades(proxy, *args)
                 except ProxyFailException as e:
                     print(e)
-                    proxy = get_proxy()
-                    if proxy is None:
-                        tasks.put(args)  # put the task back and die
-                        break
+                    proxy_pool.report_failure(proxy)
+                    # the proxy cools down, its connections are closed and a new session is made when it's back
+                    http_pool.discard(proxy)
                 else:
+                    proxy_pool.report_success(proxy, latency)
+                    page_done(args[1], rows, max_page)
                     break
+            else:
+                print("Error: failed to pull {} with {} attempts".format(args, MAX_PAGE_ATTEMPTS))
+                with lock:
+                    failed.add(args[1])
             tasks.task_done()
 
     threads = []
@@ -335,8 +502,13 @@ def load_in_parallel(stock, date):
         t.start()
         threads.append(t)
 
-    for i in range(1, 14):
-        tasks.put((stock, i))
+    for time in TIME_SLICES:
+        if journal is not None and journal.is_slice_done(stock, time):
+            slices[time] = journal.load_slice(stock, time)
+        else:
+            slices[time] = []
+            pending[time] = 1
+            tasks.put((stock, time))
 
     # block until all tasks are done
     tasks.join()
@@ -348,64 +520,107 @@ def load_in_parallel(stock, date):
     for t in threads:
         t.join()
 
-    # save resp
-    raw_data = dict(time=[], price=[], volume=[])
+    if failed:
+        raise SliceFailException("{}: failed to pull the time slices {}".format(stock, sorted(failed)))
 
-    while True:
-        try:
-            time, price, volume = responses.get(block=False)
-        except queue.Empty:
-            break
-        else:
-            time_str = re.sub(r'[^\d:]+', '', time)
-            hour, minute, *_ = time_str.split(':')
-            time = date.replace(hour=int(hour), minute=int(minute))
-            price = float(re.sub(r'[^\d\.]+', '', price))
-            volume = int(re.sub(r'[^\d]+', '', volume))
-
-            raw_data['time'].append(time)
-            raw_data['price'].append(price)
-            raw_data['volume'].append(volume)
-
-    df = pd.DataFrame(raw_data)
-    df = df[df.volume >= 1000]
-    df['cost'] = df.price * df.volume * 100
-    df['trades_count'] = 1
-    df = df.groupby(['time'])['cost', 'volume', 'trades_count'].sum()
+    trades = [row for time in TIME_SLICES for row in slices[time]]
+    return trades_to_df(trades, date)
+
+
+def clean_column(column, pattern):
+    """
+    Returns the distinct strings of a column with the `pattern` removed
+    and the codes that map the rows of the column to them.
+    The time-sales columns repeat a lot, so only the distinct values are parsed
+    """
+    codes, uniques = pd.factorize(column)
+    return pd.Series(uniques).str.replace(pattern, '', regex=True), codes
+
+
+def trades_to_df(trades, date):
+    """
+    Aggregates the (time, price, volume) text rows of time-sales pages into
+    cost, volume and trades_count of the trades >= 1000 shares per minute.
+    The cleanup and bucketing run on whole columns, not row by row
+    """
+    df = pd.DataFrame.from_records(trades, columns=['time', 'price', 'volume'])
+    if df.empty:
+        df = pd.DataFrame(dict(cost=[], volume=[], trades_count=[])).astype(
+            {'cost': float, 'volume': int, 'trades_count': int})
+    else:
+        clock, codes = clean_column(df['time'], r'[^\d:]+')
+        clock = clock.str.split(':', n=2, expand=True)
+        minutes = (clock[0].astype(int).values * 60 + clock[1].astype(int).values)[codes]
+        price, codes = clean_column(df['price'], r'[^\d\.]+')
+        price = price.astype(float).values[codes]
+        volume, codes = clean_column(df['volume'], r'[^\d]+')
+        volume = volume.astype(int).values[codes]
+
+        large = volume >= 1000
+        df = pd.DataFrame(dict(
+            cost=price[large] * volume[large] * 100,
+            volume=volume[large],
+            trades_count=1,
+        ))
+        df = df.groupby(minutes[large]).sum()
+
+    day_start = pd.Timestamp(date.replace(hour=0, minute=0, tzinfo=None))
+    times = pd.DatetimeIndex(day_start + pd.to_timedelta(df.index, unit='m'), name='time')
+    df.index = times.tz_localize(date.tzinfo) if date.tzinfo is not None else times
     return df
 
 
-def main():
-    today = datetime.now(tz=DATA_TIMEZONE).replace(second=0, microsecond=0)
-    print(today)
+def save_result(storage, today, stock, minute_data, trade_data):
+    result = pd.merge(minute_data, trade_data, how="left", left_index=True, right_index=True)
+    storage.write(today.date(), stock, result)
+
+
+def is_scraping_time(today):
     if today.hour < 16:
         logger.error("It's too early to run the scrapper")
-        return
+        return False
 
     _, last_trading_date = get_trading_dates(today)
     if last_trading_date.date() != today.date():
         logger.error("It's not a trading day")
-        return
+        return False
+    return True
+
 
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
+def main():
+    today = datetime.now(tz=DATA_TIMEZONE).replace(second=0, microsecond=0)
+    print(today)
+    if not is_scraping_time(today):
+        return
 
-    today_dir = os.path.join(DATA_DIR, str(today.date()))
-    if not os.path.exists(today_dir):
-        os.makedirs(today_dir)
+    storage = get_storage(STORAGE_BACKEND)
+    proxy_pool = ProxyPool(get_proxies())
+    journal = RunJournal(today.date())
 
     for stock in get_stocks():
+        if journal.should_skip(stock):
+            continue
         now = datetime.now()
         print(stock, now)
-        minute_data = get_minute_data(stock, today)
-        if minute_data is not None:
-            del minute_data['volume']
-            trade_data = load_in_parallel(stock, today)
-            result = pd.merge(minute_data, trade_data, how="left", left_index=True, right_index=True)
-            with open(os.path.join(today_dir, "{}.csv".format(stock)), "w") as f:
-                result.to_csv(f)
+        try:
+            minute_data = get_minute_data(stock, today)
+            if minute_data is not None:
+                del minute_data['volume']
+                trade_data = load_in_parallel(stock, today, proxy_pool, journal)
+                save_result(storage, today, stock, minute_data, trade_data)
+                proxy_pool.save()
+        except Exception as e:
+            logger.error(e)
+            journal.mark_failed(stock, e)
+        else:
+            journal.mark_done(stock)
 
         print(datetime.now() - now)
+        print(http_pool.get_stats())
+
+    dead_letters = journal.dead_letters()
+    if dead_letters:
+        print("Dead-lettered: {}".format(", ".join(dead_letters)))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,224 @@
+"""
+Storage backends for the scraped minute data.
+
+CsvStorage is the original layout, a text file per symbol per day:
+    data/<date>/<symbol>.csv
+ParquetStorage writes the same frames as compressed parquet files with typed
+columns, partitioned by date and symbol:
+    data_parquet/date=<date>/symbol=<symbol>/part-0.parquet
+Its reader only loads the requested columns and pushes the date, symbol and
+row filters down to the partitions and the row groups.
+
+Both have write(date, symbol, df) and read(symbols, start, end, columns).
+Moving the csv tree to parquet:
+    python storage.py --src data --dst data_parquet
+"""
+from datetime import date as date_type
+import argparse
+import logging
+import os
+import re
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # only the parquet storage needs it
+    pa = ds = pq = None
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = "data"
+PARQUET_DIR = "data_parquet"
+TIMEZONE = "US/Eastern"
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+FLOAT_COLUMNS = ["open", "high", "low", "close", "cost"]
+INT_COLUMNS = ["volume", "trades_count"]
+COLUMNS = FLOAT_COLUMNS + INT_COLUMNS
+
+
+def to_date_str(value):
+    if value is None or isinstance(value, str):
+        return value
+    if not isinstance(value, date_type):
+        value = pd.Timestamp(value)
+    return value.strftime("%Y-%m-%d")
+
+
+def normalize_frame(df):
+    """
+    The scraped frame with a `time` column in the data timezone and the known columns typed
+    """
+    df = df.copy()
+    df.index.name = "time"
+    df = df.reset_index()
+    times = pd.to_datetime(df["time"], utc=True)
+    df["time"] = times.dt.tz_convert(TIMEZONE)
+    for column in FLOAT_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("float64")
+    for column in INT_COLUMNS:
+        if column in df:
+            df[column] = df[column].round().astype("Int64")
+    return df
+
+
+class CsvStorage:
+
+    def __init__(self, root=DATA_DIR):
+        self.root = root
+
+    def path(self, date, symbol):
+        return os.path.join(self.root, to_date_str(date), "{}.csv".format(symbol))
+
+    def write(self, date, symbol, df):
+        day_dir = os.path.join(self.root, to_date_str(date))
+        if not os.path.exists(day_dir):
+            os.makedirs(day_dir)
+        with open(self.path(date, symbol), "w") as f:
+            df.to_csv(f)
+
+    def dates(self):
+        if not os.path.exists(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if DATE_RE.match(d))
+
+    def symbols(self, date):
+        day_dir = os.path.join(self.root, to_date_str(date))
+        return sorted(f[:-len(".csv")] for f in os.listdir(day_dir) if f.endswith(".csv"))
+
+    def read_file(self, date, symbol):
+        df = pd.read_csv(self.path(date, symbol), index_col=0)
+        df.index = pd.to_datetime(df.index, utc=True)
+        return normalize_frame(df)
+
+    def read(self, symbols=None, start=None, end=None, columns=None):
+        start, end = to_date_str(start), to_date_str(end)
+        frames = []
+        for date in self.dates():
+            if (start and date < start) or (end and date > end):
+                continue
+            for symbol in self.symbols(date):
+                if symbols is not None and symbol not in symbols:
+                    continue
+                df = self.read_file(date, symbol)
+                if columns is not None:
+                    df = df[["time"] + [c for c in columns if c in df and c != "time"]]
+                df.insert(0, "symbol", symbol)
+                df.insert(0, "date", date)
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=["date", "symbol", "time"] + (columns or []))
+        return pd.concat(frames, ignore_index=True)
+
+
+class ParquetStorage:
+
+    def __init__(self, root=PARQUET_DIR, compression="zstd"):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for the parquet storage")
+        self.root = root
+        self.compression = compression
+        self.partitioning = ds.partitioning(
+            pa.schema([("date", pa.string()), ("symbol", pa.string())]), flavor="hive")
+
+    @property
+    def schema(self):
+        fields = [pa.field("time", pa.timestamp("ns", tz=TIMEZONE))]
+        fields += [pa.field(c, pa.float64()) for c in FLOAT_COLUMNS]
+        fields += [pa.field(c, pa.int64()) for c in INT_COLUMNS]
+        return pa.schema(fields)
+
+    def path(self, date, symbol):
+        return os.path.join(self.root, "date={}".format(to_date_str(date)),
+                            "symbol={}".format(symbol), "part-0.parquet")
+
+    def write(self, date, symbol, df):
+        df = normalize_frame(df)
+        for column in COLUMNS:
+            if column not in df:
+                df[column] = None
+        table = pa.Table.from_pandas(df[["time"] + COLUMNS], schema=self.schema, preserve_index=False)
+
+        path = self.path(date, symbol)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(path), ".part-0.parquet.tmp")
+        pq.write_table(table, tmp_path, compression=self.compression)
+        os.replace(tmp_path, path)
+
+    def dataset(self):
+        return ds.dataset(self.root, format="parquet", partitioning=self.partitioning,
+                          ignore_prefixes=[".", "_"])
+
+    def read(self, symbols=None, start=None, end=None, columns=None, filter=None):
+        """
+        Loads the `columns` (all by default) of the rows passing the filters.
+        `filter` is an optional pyarrow expression on the data columns,
+        e.g. ds.field("volume") >= 10000
+        """
+        if not os.path.exists(self.root):
+            return pd.DataFrame(columns=["date", "symbol", "time"] + (columns or COLUMNS))
+
+        expression = None
+        conditions = []
+        if symbols is not None:
+            conditions.append(ds.field("symbol").isin(list(symbols)))
+        if start is not None:
+            conditions.append(ds.field("date") >= to_date_str(start))
+        if end is not None:
+            conditions.append(ds.field("date") <= to_date_str(end))
+        if filter is not None:
+            conditions.append(filter)
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        if columns is not None:
+            columns = ["date", "symbol", "time"] + [c for c in columns if c not in ("date", "symbol", "time")]
+        table = self.dataset().to_table(columns=columns, filter=expression)
+        return table.to_pandas()
+
+
+STORAGES = {
+    "csv": CsvStorage,
+    "parquet": ParquetStorage,
+}
+
+
+def get_storage(name="csv", **kwargs):
+    return STORAGES[name](**kwargs)
+
+
+def migrate(src=DATA_DIR, dst=PARQUET_DIR, compression="zstd"):
+    """
+    Copies the csv tree into the parquet storage
+    """
+    source = CsvStorage(src)
+    target = ParquetStorage(dst, compression=compression)
+    count = 0
+    for date in source.dates():
+        for symbol in source.symbols(date):
+            try:
+                df = source.read_file(date, symbol)
+            except Exception as e:
+                logger.error("{} {}: {}".format(date, symbol, e))
+                continue
+            target.write(date, symbol, df.set_index("time"))
+            count += 1
+        print(date, count)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the scraped csv files into the parquet storage")
+    parser.add_argument("--src", default=DATA_DIR)
+    parser.add_argument("--dst", default=PARQUET_DIR)
+    parser.add_argument("--compression", default="zstd")
+    args = parser.parse_args()
+    print("{} files migrated".format(migrate(args.src, args.dst, args.compression)))
+
+
+if __name__ == "__main__":
+    main()
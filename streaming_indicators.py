@@ -0,0 +1,619 @@
+"""
+Streaming indicators for the live alert loops, updated one bar at a time.
+
+Every indicator keeps a constant-size state (the rolling windows keep
+their window) and gives the value of the batch computation on all the
+bars it has seen:
+
+    update(...)  adds a closed bar and returns the value with it
+    peek(...)    returns the value with a bar that is still in progress,
+                 e.g. today's daily bar while the market is open, without adding it
+
+    rsi = RSI(14)
+    for close in history.Close:
+        rsi.update(close)
+    rsi.peek(last_price)  # the RSI as if the day closed now
+
+RSI, Directional, EMA and TSI match talib and skip a bar with a NaN, like
+talib skips the leading NaNs. The rolling windows, AO, Vortex, RVGI and the
+regression slope match the pandas rolling computations of the notebooks,
+WMA, BBANDS and AROON match talib, all of them NaN while a NaN is in the window.
+"""
+from collections import deque
+import math
+
+from panel_indicators import EPSILON, PERIOD
+
+NAN = float("nan")
+
+
+def is_nan(*values):
+    return any(value is None or value != value for value in values)
+
+
+class RollingSum:
+    """
+    Sum of the last `window` values, NaN until the window is full or while it holds a NaN
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.total = 0.0
+        self.nans = 0
+        self.updates = 0
+
+    def _next(self, value):
+        removed = self.values[0] if len(self.values) == self.window else None
+        nan = is_nan(value)
+        total = self.total + (0.0 if nan else value)
+        nans = self.nans + nan
+        if removed is not None:
+            if is_nan(removed):
+                nans -= 1
+            else:
+                total -= removed
+        full = len(self.values) + (removed is None) >= self.window
+        return total, nans, (total if full and not nans else NAN)
+
+    def peek(self, value):
+        return self._next(value)[2]
+
+    def update(self, value):
+        self.total, self.nans, result = self._next(value)
+        if len(self.values) == self.window:
+            self.values.popleft()
+        self.values.append(value)
+        self.updates += 1
+        if self.updates % self.window == 0 and not self.nans:
+            # once a window, drop the rounding drift of the running total
+            self.total = math.fsum(self.values)
+        return result
+
+
+class RollingMean(RollingSum):
+
+    def _next(self, value):
+        total, nans, result = RollingSum._next(self, value)
+        return total, nans, result / self.window
+
+
+class RollingMax:
+    """
+    Max of the last `window` values with a monotonic queue, NaN until the window is full or while it holds a NaN
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.queue = deque()  # (index, value), decreasing values
+        self.count = 0
+        self.last_nan = -1
+
+    def _start(self):
+        # the index of the oldest value of the window with the next value
+        return self.count + 1 - self.window
+
+    def peek(self, value):
+        start = self._start()
+        if start < 0 or is_nan(value) or self.last_nan >= start:
+            return NAN
+        best = value
+        for index, queued in self.queue:
+            if index >= start:
+                best = max(best, queued)
+                break
+        return best
+
+    def update(self, value):
+        result = self.peek(value)
+        start = self._start()
+        while self.queue and self.queue[0][0] < start:
+            self.queue.popleft()
+        if is_nan(value):
+            self.last_nan = self.count
+        else:
+            while self.queue and self.queue[-1][1] <= value:
+                self.queue.pop()
+            self.queue.append((self.count, value))
+        self.count += 1
+        return result
+
+
+class RSI:
+    """
+    talib RSI
+    """
+
+    def __init__(self, period=PERIOD):
+        self.period = period
+        self.previous = None
+        self.changes = 0
+        self.gain = self.loss = 0.0
+
+    def _next(self, close):
+        if self.previous is None:
+            return 0, 0.0, 0.0, NAN
+        change = close - self.previous
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        changes = self.changes + 1
+        if changes < self.period:
+            return changes, self.gain + gain, self.loss + loss, NAN
+        if changes == self.period:
+            average_gain, average_loss = (self.gain + gain) / self.period, (self.loss + loss) / self.period
+        else:
+            average_gain = (self.gain * (self.period - 1) + gain) / self.period
+            average_loss = (self.loss * (self.period - 1) + loss) / self.period
+        total = average_gain + average_loss
+        value = 0.0 if abs(total) < EPSILON else 100 * average_gain / total
+        return changes, average_gain, average_loss, value
+
+    def peek(self, close):
+        if is_nan(close):
+            return NAN
+        return self._next(close)[3]
+
+    def update(self, close):
+        if is_nan(close):
+            return NAN
+        self.changes, self.gain, self.loss, value = self._next(close)
+        self.previous = close
+        return value
+
+
+class Directional:
+    """
+    talib PLUS_DI, MINUS_DI and ADX, the values are (plus_di, minus_di, adx)
+    """
+
+    def __init__(self, period=PERIOD):
+        self.period = period
+        self.previous = None  # high, low, close
+        self.bars = 0  # the bars with a previous one
+        self.tr = self.plus_dm = self.minus_dm = 0.0
+        self.dx_sum = 0.0
+        self.adx = NAN
+
+    def _next(self, high, low, close):
+        empty = (NAN, NAN, NAN)
+        if self.previous is None:
+            return None, empty
+        previous_high, previous_low, previous_close = self.previous
+        up, down = high - previous_high, previous_low - low
+        plus_dm = up if up > 0 and up > down else 0.0
+        minus_dm = down if down > 0 and down > up else 0.0
+        tr = max(high - low, abs(high - previous_close), abs(low - previous_close))
+
+        period = self.period
+        bars = self.bars + 1
+        if bars < period:
+            return (bars, self.tr + tr, self.plus_dm + plus_dm, self.minus_dm + minus_dm, 0.0, NAN), empty
+
+        smooth_tr = self.tr - self.tr / period + tr
+        smooth_plus = self.plus_dm - self.plus_dm / period + plus_dm
+        smooth_minus = self.minus_dm - self.minus_dm / period + minus_dm
+        has_range = abs(smooth_tr) >= EPSILON
+        plus_di = 100 * smooth_plus / smooth_tr if has_range else 0.0
+        minus_di = 100 * smooth_minus / smooth_tr if has_range else 0.0
+        total = plus_di + minus_di
+        has_dx = has_range and abs(total) >= EPSILON
+        dx = 100 * abs(minus_di - plus_di) / total if has_dx else 0.0
+
+        # ADX starts as the mean of the first `period` DX, the bars without a DX don't move it
+        dx_sum, adx = self.dx_sum, self.adx
+        if bars < 2 * period - 1:
+            dx_sum += dx
+        elif bars == 2 * period - 1:
+            adx = (dx_sum + dx) / period
+        elif has_dx:
+            adx = (adx * (period - 1) + dx) / period
+        return (bars, smooth_tr, smooth_plus, smooth_minus, dx_sum, adx), (plus_di, minus_di, adx)
+
+    def peek(self, high, low, close):
+        if is_nan(high, low, close):
+            return NAN, NAN, NAN
+        return self._next(high, low, close)[1]
+
+    def update(self, high, low, close):
+        if is_nan(high, low, close):
+            return NAN, NAN, NAN
+        state, values = self._next(high, low, close)
+        if state is not None:
+            self.bars, self.tr, self.plus_dm, self.minus_dm, self.dx_sum, self.adx = state
+        self.previous = (high, low, close)
+        return values
+
+
+class AO:
+    """
+    Awesome Oscillator, SMA((High+Low)/2, fast) - SMA((High+Low)/2, slow)
+    """
+
+    def __init__(self, fast=5, slow=34):
+        self.fast = RollingMean(fast)
+        self.slow = RollingMean(slow)
+
+    def peek(self, high, low):
+        middle = (high + low) / 2
+        return self.fast.peek(middle) - self.slow.peek(middle)
+
+    def update(self, high, low):
+        middle = (high + low) / 2
+        return self.fast.update(middle) - self.slow.update(middle)
+
+
+class Vortex:
+    """
+    Vortex Indicator, the values are (vi_plus, vi_minus)
+    """
+
+    def __init__(self, period=PERIOD):
+        self.tr = RollingSum(period)
+        self.plus = RollingSum(period)
+        self.minus = RollingSum(period)
+        self.previous = None  # high, low, close
+
+    def _movements(self, high, low, close):
+        if self.previous is None:
+            return high - low, NAN, NAN
+        previous_high, previous_low, previous_close = self.previous
+        tr = max(high, previous_close) - min(low, previous_close)
+        return tr, abs(high - previous_low), abs(low - previous_high)
+
+    def peek(self, high, low, close):
+        tr, plus, minus = self._movements(high, low, close)
+        tr = self.tr.peek(tr)
+        return self.plus.peek(plus) / tr, self.minus.peek(minus) / tr
+
+    def update(self, high, low, close):
+        tr, plus, minus = self._movements(high, low, close)
+        self.previous = (high, low, close)
+        tr = self.tr.update(tr)
+        return self.plus.update(plus) / tr, self.minus.update(minus) / tr
+
+
+class EMA:
+    """
+    talib EMA, seeded with the mean of the first `period` values
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.count = 0
+        self.value = 0.0  # the sum of the values until the seed, then the EMA
+
+    def _next(self, value):
+        count = self.count + 1
+        if count < self.period:
+            return count, self.value + value, NAN
+        if count == self.period:
+            ema = (self.value + value) / self.period
+        else:
+            ema = self.value + (value - self.value) * 2 / (self.period + 1)
+        return count, ema, ema
+
+    def peek(self, value):
+        if is_nan(value):
+            return NAN
+        return self._next(value)[2]
+
+    def update(self, value):
+        if is_nan(value):
+            return NAN
+        self.count, self.value, result = self._next(value)
+        return result
+
+
+def weighted_mean(values):
+    """
+    talib WMA of a window, the weights go from 1 for the oldest value to the window size for the newest one
+    """
+    return math.fsum(weight * value for weight, value in enumerate(values, 1)) / (
+        len(values) * (len(values) + 1) / 2)
+
+
+def regression_slope(values):
+    """
+    The slope of the positions of the window regressed on its values, the N04 regression direction
+    """
+    mean = math.fsum(values) / len(values)
+    middle = (len(values) - 1) / 2
+    variance = math.fsum((value - mean) ** 2 for value in values)
+    if variance < EPSILON:
+        return NAN
+    return math.fsum((value - mean) * (i - middle) for i, value in enumerate(values)) / variance
+
+
+class RollingWindow:
+    """
+    `function` of the last `window` values, NaN until the window is full or while it holds a NaN
+    """
+
+    def __init__(self, window, function, empty=NAN):
+        self.window = window
+        self.function = function
+        self.empty = empty  # the value while there is none
+        self.values = deque(maxlen=window)
+
+    def peek(self, value):
+        values = list(self.values)[1 - self.window:] if self.window > 1 else []
+        values.append(value)
+        if len(values) < self.window or is_nan(*values):
+            return self.empty
+        return self.function(values)
+
+    def update(self, value):
+        result = self.peek(value)
+        self.values.append(value)
+        return result
+
+
+class WMA(RollingWindow):
+    """
+    talib WMA
+    """
+
+    def __init__(self, window):
+        RollingWindow.__init__(self, window, weighted_mean)
+
+
+class RegressionSlope(RollingWindow):
+    """
+    The rolling regression_slope
+    """
+
+    def __init__(self, window):
+        RollingWindow.__init__(self, window, regression_slope)
+
+
+class BollingerBands(RollingWindow):
+    """
+    talib BBANDS with the SMA, the values are (upper, middle, lower)
+    """
+
+    def __init__(self, window=5, deviations=2):
+        RollingWindow.__init__(self, window, self.bands, empty=(NAN, NAN, NAN))
+        self.deviations = deviations
+
+    def bands(self, values):
+        middle = math.fsum(values) / len(values)
+        deviation = math.sqrt(math.fsum((value - middle) ** 2 for value in values) / len(values))
+        return middle + self.deviations * deviation, middle, middle - self.deviations * deviation
+
+
+class Aroon:
+    """
+    talib AROON over the last `period` + 1 bars, the values are (aroon_down, aroon_up)
+    """
+
+    def __init__(self, period=PERIOD):
+        self.period = period
+        self.bars = deque(maxlen=period)  # high, low
+
+    def peek(self, high, low):
+        bars = list(self.bars) + [(high, low)]
+        if len(bars) <= self.period or is_nan(*(value for bar in bars for value in bar)):
+            return NAN, NAN
+        # the latest of the equal highs and lows, like talib
+        highest = max(range(len(bars)), key=lambda i: (bars[i][0], i))
+        lowest = min(range(len(bars)), key=lambda i: (bars[i][1], -i))
+        return 100.0 * lowest / self.period, 100.0 * highest / self.period
+
+    def update(self, high, low):
+        result = self.peek(high, low)
+        self.bars.append((high, low))
+        return result
+
+
+class TSI:
+    """
+    True Strength Index with the N04 periods, the values are (tsi, signal)
+    """
+
+    def __init__(self, first=25, second=13, signal=13):
+        self.previous = None
+        self.momentum = [EMA(first), EMA(second)]
+        self.absolute = [EMA(first), EMA(second)]
+        self.signal = EMA(signal)
+
+    def _next(self, close, method):
+        if self.previous is None or is_nan(close):
+            return NAN, NAN
+        momentum = absolute = close - self.previous
+        absolute = abs(absolute)
+        for stream in self.momentum:
+            momentum = getattr(stream, method)(momentum)
+        for stream in self.absolute:
+            absolute = getattr(stream, method)(absolute)
+        tsi = NAN if is_nan(momentum, absolute) or abs(absolute) < EPSILON else momentum / absolute * 100
+        return tsi, getattr(self.signal, method)(tsi)
+
+    def peek(self, close):
+        return self._next(close, "peek")
+
+    def update(self, close):
+        values = self._next(close, "update")
+        if not is_nan(close):
+            self.previous = close
+        return values
+
+
+class RVGI:
+    """
+    Relative Vigor Index with the N04 periods, the values are (green, red)
+    """
+
+    def __init__(self, period=10, signal=4):
+        self.green = RollingMean(period)
+        self.red = WMA(signal)
+
+    def _vigor(self, open_, high, low, close):
+        return NAN if is_nan(high, low) or high == low else (close - open_) / (high - low)
+
+    def peek(self, open_, high, low, close):
+        green = self.green.peek(self._vigor(open_, high, low, close))
+        return green, self.red.peek(green)
+
+    def update(self, open_, high, low, close):
+        green = self.green.update(self._vigor(open_, high, low, close))
+        return green, self.red.update(green)
+
+
+class GapPattern:
+    """
+    The N01 get_pattern_instances columns of one symbol, a dict per bar
+    """
+
+    def __init__(self, high_window=89, volume_window=5, period=PERIOD):
+        self.rsi = RSI(period)
+        self.directional = Directional(period)
+        self.max_close = RollingMax(high_window)
+        self.average_volume = RollingMean(volume_window)
+        self.previous_close = NAN
+        self.previous_max = NAN
+        self.previous_average = NAN
+
+    def _values(self, bar, rsi, directional, max_close, average_volume):
+        open_, close, volume = bar["Open"], bar["Close"], bar["Volume"]
+        plus_di, minus_di, adx = directional
+        return dict(
+            RSI=rsi,
+            PLUS_DI=plus_di,
+            MINUS_DI=minus_di,
+            ADX=adx,
+            OpeningGap=(open_ - self.previous_close) / self.previous_close * 100,
+            Recent5daysAvgVolume=average_volume,
+            VolumeGap=(volume - self.previous_average) / self.previous_average,
+            Prev89daysMaxClose=max_close,
+            MaxHigh90Days=close > self.previous_max,
+        )
+
+    def peek(self, bar):
+        """
+        `bar` has the Open, High, Low, Close, Volume keys
+        """
+        return self._values(
+            bar,
+            self.rsi.peek(bar["Close"]),
+            self.directional.peek(bar["High"], bar["Low"], bar["Close"]),
+            self.max_close.peek(bar["Close"]),
+            self.average_volume.peek(bar["Volume"]),
+        )
+
+    def update(self, bar):
+        values = self._values(
+            bar,
+            self.rsi.update(bar["Close"]),
+            self.directional.update(bar["High"], bar["Low"], bar["Close"]),
+            self.max_close.update(bar["Close"]),
+            self.average_volume.update(bar["Volume"]),
+        )
+        self.previous_close = bar["Close"]
+        self.previous_max = values["Prev89daysMaxClose"]
+        self.previous_average = values["Recent5daysAvgVolume"]
+        return values
+
+    @staticmethod
+    def is_instance(values, opening_gap=3, volume_gap=0.5, rsi=70):
+        """
+        The N01 conditions, NaN values fail them
+        """
+        return bool(values["MaxHigh90Days"] and values["VolumeGap"] > volume_gap
+                    and values["OpeningGap"] >= opening_gap and values["RSI"] > rsi
+                    and values["PLUS_DI"] > values["MINUS_DI"])
+
+    @classmethod
+    def from_frame(cls, df, **kwargs):
+        """
+        A pattern stream warmed up with the closed bars of `df`
+        """
+        stream = cls(**kwargs)
+        for bar in df[["Open", "High", "Low", "Close", "Volume"]].to_dict("records"):
+            stream.update(bar)
+        return stream
+
+
+class TrendPattern:
+    """
+    The N04 get_pattern_instances columns of one symbol, a dict per bar
+    """
+
+    def __init__(self, high_window=19, ao_window=30, regression_window=45):
+        self.max_close = RollingMax(high_window)
+        self.ao = AO()
+        self.ao_mean = RollingMean(ao_window)
+        self.price_regression = RegressionSlope(regression_window)
+        self.ao_regression = RegressionSlope(regression_window)
+        self.aroon = Aroon()
+        self.vortex = Vortex()
+        self.tsi = TSI()
+        self.bbands = BollingerBands()
+        self.rvgi = RVGI()
+        self.previous_max = NAN
+
+    def _values(self, bar, method):
+        open_, high, low, close = bar["Open"], bar["High"], bar["Low"], bar["Close"]
+
+        def call(stream, *args):
+            return getattr(stream, method)(*args)
+
+        ao = call(self.ao, high, low)
+        aroon_down, aroon_up = call(self.aroon, high, low)
+        vi_plus, vi_minus = call(self.vortex, high, low, close)
+        tsi, tsi_red = call(self.tsi, close)
+        bb_upper, bb_middle, bb_lower = call(self.bbands, close)
+        rvgi_green, rvgi_red = call(self.rvgi, open_, high, low, close)
+        return dict(
+            AO=ao,
+            max19daysClose=call(self.max_close, close),
+            average30daysAO=call(self.ao_mean, ao),
+            PR=call(self.price_regression, close),
+            AOR=call(self.ao_regression, ao),
+            AROON_DOWN=aroon_down,
+            AROON_UP=aroon_up,
+            VI_PLUS=vi_plus,
+            VI_MINUS=vi_minus,
+            TSI=tsi,
+            TSI_RED=tsi_red,
+            BB_UPPER=bb_upper,
+            BB_MIDDLE=bb_middle,
+            BB_LOWER=bb_lower,
+            RVGI_GREEN=rvgi_green,
+            RVGI_RED=rvgi_red,
+            NewHigh20Days=close > self.previous_max,
+            PierceUpperBand=high > bb_upper,
+        )
+
+    def peek(self, bar):
+        """
+        `bar` has the Open, High, Low, Close keys
+        """
+        return self._values(bar, "peek")
+
+    def update(self, bar):
+        values = self._values(bar, "update")
+        self.previous_max = values["max19daysClose"]
+        return values
+
+    @staticmethod
+    def is_instance(values):
+        """
+        The N04 conditions, NaN values fail them
+        """
+        return bool(values["NewHigh20Days"]
+                    and values["AO"] > 0 and values["average30daysAO"] < 0
+                    and values["PR"] < 0 and values["AOR"] > 0
+                    and values["AROON_UP"] > values["AROON_DOWN"]
+                    and values["VI_PLUS"] > values["VI_MINUS"]
+                    and values["TSI"] > values["TSI_RED"]
+                    and values["PierceUpperBand"]
+                    and values["RVGI_GREEN"] > values["RVGI_RED"])
+
+    @classmethod
+    def from_frame(cls, df, **kwargs):
+        """
+        A pattern stream warmed up with the closed bars of `df`
+        """
+        stream = cls(**kwargs)
+        for bar in df[["Open", "High", "Low", "Close"]].to_dict("records"):
+            stream.update(bar)
+        return stream
@@ -0,0 +1,130 @@
+"""
+HTML tables of the notebooks, built with one join and refreshed in place.
+
+A frame is formatted a column at a time and the rows are joined once:
+
+    draw_table(df[:100], ("Stock", "Share price"), ("symbol", "price"))
+
+The monitors show the same records cycle after cycle, so a TableView keeps
+the formatted row of every record it showed and only formats the new ones.
+Every row of the table is its own display, updated in place, and only the
+rows that changed are sent to the browser again:
+
+    view = TableView(headers, row)   # row is a str.format template of a record or a function
+    view.show(largest_transactions, note="last update ...")
+"""
+from itertools import zip_longest
+
+from IPython.display import HTML, Pretty, display
+
+ROW_SLOTS = 50  # the rows displayed at first, empty until used
+ROW_TABLE = '<table style="table-layout: fixed; width: 100%; margin: 0">{}</table>'
+
+
+def header_row(headers):
+    return "<tr><th>" + "</th><th>".join(headers) + "</th></tr>"
+
+
+def format_column(series, fmt=None):
+    """
+    The cells of a column as strings, str() of the values or `fmt` applied to them
+    """
+    if fmt is None:
+        fmt = str
+    elif isinstance(fmt, str):
+        fmt = fmt.format
+    return list(map(fmt, series.tolist()))
+
+
+def html_table(df, headers, fields, formats=None):
+    """
+    The html table of the fields of a frame, `formats` are format strings or functions by field
+    """
+    formats = formats or {}
+    columns = [format_column(df[field], formats.get(field)) for field in fields]
+    rows = "".join("<tr><td>" + "</td><td>".join(cells) + "</td></tr>" for cells in zip(*columns))
+    return "<table>" + header_row(headers) + rows + "</table>"
+
+
+def draw_table(df, headers, fields, formats=None):
+    """
+    Displays the html table of the fields of a frame
+    """
+    display(HTML(html_table(df, headers, fields, formats)))
+
+
+class TableView:
+    """
+    A table of records (dicts) displayed once and updated in place a row at a time, the rows of
+    the records already shown are taken from a cache
+    """
+
+    def __init__(self, headers, row, key=None, size=ROW_SLOTS):
+        self.header = header_row(headers)
+        self.row = row
+        self.key = key or (lambda record: tuple(record.values()))
+        self.size = size
+        self.cache = {}  # key -> formatted row of the records of the last table
+        self.rows = []
+        self.note = None
+        self.header_handle = None
+        self.row_handles = []
+        self.note_handle = None
+
+    def format(self, record):
+        return self.row.format(**record) if isinstance(self.row, str) else self.row(record)
+
+    def format_rows(self, records):
+        """
+        The rows of the records, only the records that weren't in the last table are formatted
+        """
+        cache = {}
+        rows = []
+        for record in records:
+            key = self.key(record)
+            row = cache.get(key)
+            if row is None:
+                row = self.cache.get(key)
+                if row is None:
+                    row = self.format(record)
+                cache[key] = row
+            rows.append(row)
+        self.cache = cache
+        return rows
+
+    def render(self, row):
+        # a table per row, the fixed layout keeps the columns of the rows aligned
+        return ROW_TABLE.format(row)
+
+    def display_slots(self, size):
+        """
+        Displays the header, `size` empty row slots and the note, the ones displayed before are emptied
+        """
+        for handle in [self.header_handle, self.note_handle] + self.row_handles:
+            if handle is not None:
+                handle.update(HTML(""))
+        self.header_handle = display(HTML(self.render(self.header)), display_id=True)
+        self.row_handles = [display(HTML(""), display_id=True) for _ in range(size)]
+        self.note_handle = display(Pretty(self.note or ""), display_id=True)
+        self.rows = []
+
+    def show(self, records, note=None):
+        """
+        Displays the records, only the rows that changed are sent. Returns their number
+        """
+        rows = self.format_rows(records)
+        if self.header_handle is None or len(rows) > len(self.row_handles):
+            # the slots of a table that outgrew them are displayed again, twice as many
+            self.display_slots(max(len(rows), 2 * len(self.row_handles), self.size))
+
+        changed = 0
+        for i, (new, old) in enumerate(zip_longest(rows, self.rows)):
+            if new != old:
+                self.row_handles[i].update(HTML("" if new is None else self.render("<tr>{}</tr>".format(new))))
+                changed += 1
+        self.rows = rows
+
+        if note is not None and note != self.note:
+            self.note_handle.update(Pretty(note))
+            self.note = note
+        return changed
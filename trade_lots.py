@@ -0,0 +1,260 @@
+"""
+The trade lots of a session from the nasdaq time-sales pages, pulled incrementally.
+
+The time-sales of a stock are split in 13 half-hour time slices, time=1 is
+9:30-10:00 ET and time=13 is 15:30-16:00. A slice that is over (plus a
+couple of minutes for the late reports) doesn't change anymore, so its
+lots are kept once pulled and it is never requested again. A refresh only
+pulls the slice in progress and the past slices that weren't pulled yet,
+the pages of all of them at once.
+
+When the pages of a slice are in time order the new trades are appended
+to its last page, so only the last page and the ones after it are pulled
+again. When they aren't, a new trade shifts the rows of every page and
+the slice in progress is pulled whole.
+
+    lots = TradeLots(tz=LOCAL_TZ)
+    lots.update(["AAPL", "BAC"], now)
+    lots.trades()      # a row per trade of 1000 shares or more
+    lots.by_minute()   # Symbol, TimePeriod, Time, Cost, Count of every minute
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from time import sleep
+import logging
+
+import pandas as pd
+
+import http_pool
+from stock_scraper import (
+    DATA_TIMEZONE, TIME_SLICES, TRADES_URL, TradesPageParser, backoff_time, clean_column, stream_trades_page,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 10
+TIMEOUT = 12
+ATTEMPTS = 4
+MIN_VOLUME = 1000
+SLICE_MINUTES = 30
+SETTLE = timedelta(minutes=2)  # the trades of a slice can be reported a bit after it's over
+TRADES_COLUMNS = ["Symbol", "TimePeriod", "Time", "Minute", "Price", "Volume", "Cost"]
+MINUTE_COLUMNS = ["Symbol", "TimePeriod", "Time", "Cost", "Volume", "Count"]
+
+
+class PullException(Exception):
+    pass
+
+
+def market_open(now):
+    return now.astimezone(DATA_TIMEZONE).replace(hour=9, minute=30, second=0, microsecond=0)
+
+
+def current_slice(now):
+    """
+    The time slice in progress, 0 before the open and the last one after it
+    """
+    minutes = (now - market_open(now)).total_seconds() // 60
+    if minutes < 0:
+        return 0
+    return min(int(minutes // SLICE_MINUTES) + 1, TIME_SLICES[-1])
+
+
+def slice_end(time, now):
+    return market_open(now) + timedelta(minutes=SLICE_MINUTES * time)
+
+
+def clock_seconds(text):
+    """
+    "9:30:01 AM" -> 34201
+    """
+    hour, minute, second = (text.split(":") + ["0", "0"])[:3]
+    return int(hour) * 3600 + int(minute) * 60 + int("".join(c for c in second if c.isdigit()) or 0)
+
+
+def fetch_page(symbol, time, pageno):
+    """
+    The trade rows of a time-sales page and the number of the last page of the slice.
+    A page of another time slice than the requested one is a wrong response from the server
+    """
+    url = TRADES_URL.format(symbol=symbol.lower(), time=time, pageno=pageno)
+    for attempt in range(1, ATTEMPTS + 1):
+        try:
+            parser = TradesPageParser(read_time_range=True)
+            rows, max_page = stream_trades_page(http_pool.get(url, timeout=TIMEOUT, stream=True), parser)
+            if rows is None:
+                raise PullException("The table is missing")
+            if parser.time_range is None or int(parser.time_range) != time:
+                raise PullException("Wrong response from server, time range {}".format(parser.time_range))
+            return rows, max_page or 1
+        except Exception as e:
+            logger.warning("{}: {}, attempt {}".format(url, e, attempt))
+            sleep(backoff_time(attempt))
+    raise PullException("Failed to pull {}, you've probably been blocked by nasdaq".format(url))
+
+
+def trades_frame(symbol, time, rows, min_volume=MIN_VOLUME):
+    """
+    The trades of `min_volume` shares or more of the (time, price, volume) text rows of a slice
+    """
+    df = pd.DataFrame.from_records(rows, columns=["time", "price", "volume"])
+    if df.empty:
+        return pd.DataFrame(columns=TRADES_COLUMNS)
+    clock, codes = clean_column(df["time"], r"[^\d:]+")
+    clock = clock.values[codes]
+    price, codes = clean_column(df["price"], r"[^\d\.]+")
+    price = price.astype(float).values[codes]
+    volume, codes = clean_column(df["volume"], r"[^\d]+")
+    volume = volume.astype(int).values[codes]
+
+    large = volume >= min_volume
+    df = pd.DataFrame(dict(Symbol=symbol, TimePeriod=time, Time=clock[large], Price=price[large],
+                           Volume=volume[large]), columns=TRADES_COLUMNS)
+    if len(df):
+        parts = df.Time.str.split(":", n=2, expand=True)
+        df["Minute"] = parts[0].str.zfill(2) + ":" + parts[1].str.zfill(2)
+    df["Cost"] = df.Price * df.Volume * 100
+    return df
+
+
+def minute_frame(trades, now, tz=None):
+    """
+    The cost, volume and number of the trades of every minute, the minute as a datetime in `tz`
+    """
+    if trades.empty:
+        return pd.DataFrame(columns=MINUTE_COLUMNS)
+    df = trades.assign(Count=1).groupby(["Symbol", "TimePeriod", "Minute"], as_index=False)[
+        ["Cost", "Volume", "Count"]].sum()
+    day_start = now.astimezone(DATA_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+    minutes = df.Minute.str[:2].astype(int) * 60 + df.Minute.str[3:5].astype(int)
+    times = pd.Timestamp(day_start) + pd.to_timedelta(minutes, unit="m")
+    df["Time"] = times.dt.tz_convert(tz) if tz is not None else times
+    return df[MINUTE_COLUMNS]
+
+
+class TradeLots:
+    """
+    The trade lots of the session by symbol and time slice, the slices that are over are pulled once
+    """
+
+    def __init__(self, tz=None, min_volume=MIN_VOLUME, max_workers=MAX_WORKERS):
+        self.tz = tz
+        self.min_volume = min_volume
+        self.max_workers = max_workers
+        self.clear()
+
+    def clear(self):
+        self.session = None
+        self.pages = {}  # (symbol, time) -> {pageno: rows} of the slices in progress
+        self.ordered = {}  # (symbol, time) -> whether its pages are in time order
+        self.slices = {}  # (symbol, time) -> (trades, minutes)
+        self.final = set()  # the slices that are over and pulled
+        self.final_frames = None
+
+    def is_ordered(self, pages):
+        """
+        Whether the trades of the pages go from the oldest to the newest one
+        """
+        if len(pages) < 2:
+            return False
+        first, last = pages[min(pages)], pages[max(pages)]
+        try:
+            return clock_seconds(first[0][0]) < clock_seconds(last[-1][0])
+        except (IndexError, ValueError):
+            return False
+
+    def update(self, symbols, now):
+        """
+        Pulls the new trades of the symbols up to now, returns the number of pages pulled
+        """
+        if now.astimezone(DATA_TIMEZONE).date() != self.session:
+            self.clear()
+            self.session = now.astimezone(DATA_TIMEZONE).date()
+
+        starts = {}  # (symbol, time) -> the first page to pull
+        for symbol in symbols:
+            for time in range(1, current_slice(now) + 1):
+                key = (symbol, time)
+                if key in self.final:
+                    continue
+                pages = self.pages.get(key)
+                starts[key] = max(pages) if pages and self.ordered.get(key) else 1
+
+        pulled = {key: {} for key in starts}
+        max_pages = {}
+        failed = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(fetch_page, symbol, time, start): (symbol, time, start, True)
+                       for (symbol, time), start in starts.items()}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    symbol, time, pageno, first = futures.pop(future)
+                    key = (symbol, time)
+                    try:
+                        rows, max_page = future.result()
+                    except Exception as e:
+                        logger.error("{} {}: {}".format(symbol, time, e))
+                        failed.add(key)
+                        continue
+                    pulled[key][pageno] = rows
+                    if not first:
+                        continue
+                    max_pages[key] = max_page
+                    for pn in range(pageno + 1, max_page + 1):
+                        future = executor.submit(fetch_page, symbol, time, pn)
+                        futures[future] = (symbol, time, pn, False)
+                        pending.add(future)
+
+        for key, pages in pulled.items():
+            if key in failed:
+                continue
+            symbol, time = key
+            if starts[key] > 1:
+                pages = {pn: rows for pn, rows in self.pages[key].items() if pn < starts[key]}
+                pages.update(pulled[key])
+            pages = {pn: rows for pn, rows in pages.items() if pn <= max_pages[key]}
+            rows = [row for pn in sorted(pages) for row in pages[pn]]
+            trades = trades_frame(symbol, time, rows, self.min_volume)
+            self.slices[key] = (trades, minute_frame(trades, now, self.tz))
+            if now >= slice_end(time, now) + SETTLE:
+                self.final.add(key)
+                self.pages.pop(key, None)
+                self.ordered.pop(key, None)
+                self.final_frames = None
+            else:
+                self.pages[key] = pages
+                self.ordered[key] = self.is_ordered(pages)
+        return sum(len(pages) for pages in pulled.values())
+
+    def frames(self, which):
+        """
+        The trades (0) or minutes (1) frames of the final slices concatenated once, and of the other ones
+        """
+        if self.final_frames is None:
+            self.final_frames = tuple(
+                [pd.concat([self.slices[key][n] for key in sorted(self.final)], ignore_index=True)]
+                if self.final else [] for n in (0, 1))
+        rest = [self.slices[key][which] for key in sorted(self.slices) if key not in self.final]
+        return self.final_frames[which] + rest
+
+    def trades(self, symbols=None):
+        """
+        A row per trade of `min_volume` shares or more: Symbol, TimePeriod, Time, Minute, Price, Volume, Cost
+        """
+        frames = self.frames(0)
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=TRADES_COLUMNS)
+        if symbols is not None:
+            df = df[df.Symbol.isin(list(symbols))].reset_index(drop=True)
+        return df
+
+    def by_minute(self, symbols=None):
+        """
+        The trades of every minute: Symbol, TimePeriod, Time, Cost, Volume, Count, by symbol and time
+        """
+        frames = self.frames(1)
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=MINUTE_COLUMNS)
+        if symbols is not None:
+            df = df[df.Symbol.isin(list(symbols))]
+        return df.sort_values(by=["Symbol", "Time"]).reset_index(drop=True)